@@ -1,9 +1,26 @@
 import mido
 import time
 import argparse
+import contextlib
+import copy
+import hashlib
+import heapq
+import io
+import json
 import os
+import sys
+import tempfile
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from pathlib import Path
+from time import perf_counter_ns
+
+# Private to mido, but its only way to build a meta message from a type and
+# payload: MetaMessage.from_bytes() misreads 128-byte payloads (mido 1.3).
+# tests/test_packed.py round-trips every payload size class through it.
+from mido.midifiles.meta import build_meta_message
 
 # --- Bank Constants ---
 GM2_MSB = 121      # GM2 Bank MSB for melodic instruments
@@ -495,6 +512,7 @@ MANUFACTURER_ID = 0x41  # Roland
 DEVICE_ID = 0x10       # Default device ID
 MODEL_ID = 0x6C        # Integra-7
 COMMAND_DT1 = 0x12     # Data Set 1
+COMMAND_RQ1 = 0x11     # Data Request 1
 
 # --- Studio Set Addresses ---
 STUDIO_SET_MODE = 0x0F000402
@@ -508,12 +526,28 @@ TONE_BANK_MSB = 0x0002     # Bank Select MSB
 TONE_BANK_LSB = 0x0003     # Bank Select LSB
 TONE_PC = 0x0004           # Program Number
 TONE_BANK_TYPE = 0x0007    # Tone Bank Type (0: PCM Synth, 1: SN-A, 2: SN-S, 3: SN-D)
+PART_BLOCK_SIZE = 0x0008   # Bytes requested when reading a part back (PART_SWITCH..TONE_BANK_TYPE)
+
+# Tone Bank Type value for each bank select MSB
+TONE_BANK_TYPES = {
+    89: 1,            # SN-A
+    95: 2,            # SN-S
+    88: 3,            # SN-D
+    GM2_MSB: 0,       # PCM Synth
+    GM2_DRUM_MSB: 0,  # PCM Synth
+}
+
+# Bank name for each bank select MSB, for reports
+BANK_NAMES = {89: "SN-A", 95: "SN-S", 88: "SN-D", GM2_MSB: "GM2", GM2_DRUM_MSB: "GM2"}
 
 # --- Drum Kit Constants ---
 SN_DRUM_MSB = 88  # MSB for SuperNATURAL Drum Kits
 SN_DRUM_LSB = 64  # LSB for SuperNATURAL Drum Kits
 DRUM_CHANNEL = 9  # MIDI channel 10 (0-based)
 
+# Ticks to wait after a tone bank type change and after a program change
+SETTLE_TICKS = 10
+
 # Define which drum kits have good SuperNATURAL mappings
 SN_DRUM_KITS = {
     0: "Standard Kit",      # Standard Kit
@@ -559,17 +593,17 @@ GM2_DRUM_MAP = {
     43: 40,  # Brush Kit 4 -> Brush Kit
 }
 
-def create_sysex(address, data):
-    """Creates a Roland SysEx message."""
+def create_sysex(address, data, command=COMMAND_DT1, device_id=DEVICE_ID):
+    """Creates a Roland SysEx message (DT1 by default; RQ1 takes a size as data)."""
     addr_msb = (address >> 16) & 0xFF
     addr_mid = (address >> 8) & 0xFF
     addr_lsb = address & 0xFF
     
     msg_data = [
         MANUFACTURER_ID,    # Roland
-        DEVICE_ID,         # Device ID
+        device_id,         # Device ID
         MODEL_ID,          # Integra-7
-        COMMAND_DT1,       # Command
+        command,           # Command
         addr_msb,          # Address MSB
         addr_mid,          # Address Middle
         addr_lsb,         # Address LSB
@@ -585,6 +619,111 @@ def create_sysex(address, data):
     
     return mido.Message('sysex', data=msg_data)
 
+# --- Packed Event Model ---
+def _message_event(msg):
+    """Returns (status, data) for a mido message in PackedTrack's event format."""
+    if msg.is_meta:
+        encoded = msg.bytes()  # FF, type, variable-length size, payload
+        payload_start = 2
+        while encoded[payload_start] & 0x80:
+            payload_start += 1
+        return 0xFF, bytes([encoded[1]]) + bytes(encoded[payload_start + 1:])
+    if msg.type == 'sysex':
+        return 0xF0, bytes(msg.data) + b'\xf7'
+    encoded = msg.bytes()
+    return encoded[0], bytes(encoded[1:])
+
+def _event_message(delta, status, data):
+    """Builds the mido message for a packed event."""
+    if status == 0xFF:
+        return build_meta_message(data[0], list(data[1:]), delta)
+    if status in (0xF0, 0xF7):
+        return mido.Message('sysex', data=data[:-1] if data.endswith(b'\xf7') else data, time=delta)
+    return mido.Message.from_bytes([status, *data], time=delta)
+
+class PackedTrack:
+    """A track stored as packed bytes instead of one mido object per event.
+
+    Events are kept back to back in one bytearray as their status byte and
+    data, in the format iter_track_events() yields (meta: type byte and
+    payload; SysEx: payload with the closing F7). ``offsets`` indexes where
+    each event starts and ``deltas`` holds its delta time, so an event costs
+    its own bytes plus eight bytes of index. Iterating yields mido messages
+    for code at the API boundary; the converter uses events().
+    """
+    __slots__ = ('data', 'offsets', 'deltas')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('I', [0])
+        self.deltas = array('I')
+
+    @classmethod
+    def from_messages(cls, messages):
+        """Packs an iterable of mido messages."""
+        track = cls()
+        for msg in messages:
+            track.append(msg)
+        return track
+
+    def append_event(self, delta, status, data):
+        """Appends a raw event."""
+        self.data.append(status)
+        self.data += data
+        self.offsets.append(len(self.data))
+        self.deltas.append(delta)
+
+    def append(self, msg):
+        """Appends a mido message, so set-up helpers can build packed tracks."""
+        self.append_event(msg.time, *_message_event(msg))
+
+    def events(self):
+        """Yields (delta, status, data) for every event."""
+        data = self.data
+        offsets = self.offsets
+        for i, delta in enumerate(self.deltas):
+            start = offsets[i]
+            yield delta, data[start], bytes(data[start + 1:offsets[i + 1]])
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def __iter__(self):
+        for delta, status, data in self.events():
+            yield _event_message(delta, status, data)
+
+class PackedMidiFile:
+    """Ticks per beat and a list of PackedTracks."""
+    __slots__ = ('ticks_per_beat', 'tracks')
+
+    def __init__(self, ticks_per_beat=480, tracks=None):
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = [] if tracks is None else tracks
+
+    @classmethod
+    def from_midi_file(cls, mid):
+        """Packs a mido MidiFile."""
+        return cls(mid.ticks_per_beat, [PackedTrack.from_messages(track) for track in mid.tracks])
+
+    def to_midi_file(self):
+        """Unpacks into a mido MidiFile."""
+        mid = mido.MidiFile(ticks_per_beat=self.ticks_per_beat)
+        for track in self.tracks:
+            mid.tracks.append(mido.MidiTrack(track))
+        return mid
+
+def read_packed_midi(input_midi_path):
+    """Reads a Standard MIDI File straight into a PackedMidiFile."""
+    with open(input_midi_path, 'rb') as f:
+        _, _, ticks_per_beat = read_smf_header(f)
+        packed = PackedMidiFile(ticks_per_beat)
+        for chunk in list(iter_track_chunks(f)):
+            track = PackedTrack()
+            for delta, status, data in iter_track_events(f, *chunk):
+                track.append_event(delta, status, data)
+            packed.tracks.append(track)
+    return packed
+
 def initialize_part(track, part_num):
     """Initialize a part with basic settings."""
     # Reset All Controllers
@@ -597,13 +736,18 @@ def initialize_part(track, part_num):
     if part_num != DRUM_CHANNEL:
         track.append(mido.Message('note_on', note=0, velocity=0, time=10))
 
-def set_bank_and_program(track, channel, msb, lsb, program):
-    """Set bank and program numbers using MIDI CC messages."""
+def set_bank_and_program(track, channel, msb, lsb, program, time=0, device_id=DEVICE_ID):
+    """Set bank and program numbers using MIDI CC messages.
+
+    ``time`` is the delta carried by the first message of the block, so the
+    change lands at the position of the program change it replaces.
+    ``device_id`` addresses the bank type SysEx to one unit in a rack.
+    """
     if channel == DRUM_CHANNEL:
         print(f"\nWriting drum channel messages:")
     
     # Reset All Controllers
-    track.append(mido.Message('control_change', channel=channel, control=121, value=0, time=0))
+    track.append(mido.Message('control_change', channel=channel, control=121, value=0, time=time))
     if channel == DRUM_CHANNEL:
         print("  Reset All Controllers")
     
@@ -616,28 +760,28 @@ def set_bank_and_program(track, channel, msb, lsb, program):
     part_address = STUDIO_SET_PART_BASE + (channel * PART_OFFSET) + TONE_BANK_TYPE
     bank_type = None
     if msb == 89:  # SN-A
-        track.append(create_sysex(part_address, [1]))  # Type 1 = SN-A
+        track.append(create_sysex(part_address, [1], device_id=device_id))  # Type 1 = SN-A
         bank_type = "SN-A"
         if channel == DRUM_CHANNEL:
             print("  SysEx Bank Type: SN-A (1)")
     elif msb == 88:  # SN-D
-        track.append(create_sysex(part_address, [3]))  # Type 3 = SN-D
+        track.append(create_sysex(part_address, [3], device_id=device_id))  # Type 3 = SN-D
         bank_type = "SN-D"
         if channel == DRUM_CHANNEL:
             print("  SysEx Bank Type: SN-D (3)")
     elif msb == 95:  # SN-S
-        track.append(create_sysex(part_address, [2]))  # Type 2 = SN-S
+        track.append(create_sysex(part_address, [2], device_id=device_id))  # Type 2 = SN-S
         bank_type = "SN-S"
         if channel == DRUM_CHANNEL:
             print("  SysEx Bank Type: SN-S (2)")
     elif msb == GM2_MSB:  # GM2
-        track.append(create_sysex(part_address, [0]))  # Type 0 = PCM Synth
+        track.append(create_sysex(part_address, [0], device_id=device_id))  # Type 0 = PCM Synth
         bank_type = "GM2"
         if channel == DRUM_CHANNEL:
             print("  SysEx Bank Type: PCM Synth (0)")
     
     # Minimal delay after tone bank type change
-    track.append(mido.Message('note_on', note=0, velocity=0, time=10))
+    track.append(mido.Message('note_on', note=0, velocity=0, time=SETTLE_TICKS))
     
     # Send Bank Select MSB (CC#0)
     track.append(mido.Message('control_change', channel=channel, control=0, value=msb, time=0))
@@ -655,253 +799,1795 @@ def set_bank_and_program(track, channel, msb, lsb, program):
         print(f"  Program Change: {program}")
     
     # Minimal delay after program change
-    track.append(mido.Message('note_on', note=0, velocity=0, time=10))
+    track.append(mido.Message('note_on', note=0, velocity=0, time=SETTLE_TICKS))
     
     print(f"Set Channel {channel}: Bank={bank_type}, MSB={msb}, LSB={lsb}, Program={program}")
 
-def map_gm1_to_supernatural(input_midi_path, output_midi_path):
-    """Maps a GM1 MIDI file to use Supernatural sounds."""
+def map_program(channel, program):
+    """Returns (msb, lsb, program, label) for a GM1 program change on a channel."""
+    if channel == DRUM_CHANNEL:
+        if program in SN_DRUM_KITS:
+            return SN_DRUM_MSB, SN_DRUM_LSB, program, f"SN-D {SN_DRUM_KITS[program]}"
+        gm2_program = GM2_DRUM_MAP.get(program, 0)  # Default to Standard Kit if no mapping
+        return GM2_DRUM_MSB, GM2_LSB, gm2_program, f"GM2 Kit {gm2_program}"
+    
+    program_num, tone_name = SUPERNATURAL_MAP[program]
+    if tone_name == "GM2":
+        return GM2_MSB, GM2_LSB, program, tone_name  # Use original program number for GM2
+    category = TONE_CATEGORY[tone_name]
+    return BANK_MSB[category], BANK_LSB[category], program_num, tone_name
+
+def select_program(channel_program_map, channel, program, leading=False):
+    """Returns the map_program() target for a program change, or None if the part already has it.
+
+    ``leading`` selects the rules for the set-up done at the start of a track:
+    the drum channel is only set up there if nothing has initialized it yet.
+    Drum kits are compared by program number only.
+    """
+    if channel == DRUM_CHANNEL and leading and channel in channel_program_map:
+        return None
+    target = map_program(channel, program)
+    current = channel_program_map.get(channel)
+    if current is None:
+        return target
+    if channel == DRUM_CHANNEL:
+        return None if current[2] == target[2] else target
+    return None if current == target[:3] else target
+
+def unit_for_port(port, units):
+    """Returns the Integra-7 unit that plays a source MIDI port."""
+    return port % units
+
+def unit_device_ids(units):
+    """Default device IDs for a rack of units: DEVICE_ID, DEVICE_ID + 1, ..."""
+    return tuple(DEVICE_ID + unit for unit in range(units))
+
+def track_port(track):
+    """Returns the port of the PackedTrack's first midi_port meta event, or 0 if it has none."""
+    for _, status, data in track.events():
+        if _is_port_event(status, data):
+            return data[1]
+    return 0
+
+def _is_port_event(status, data):
+    """Checks whether a packed event is a midi_port meta event."""
+    return status == 0xFF and data[0] == MIDI_PORT_META and len(data) > 1
+
+def port_collisions(mid, units):
+    """Returns (unit, channel, ports) for every unit channel that several source ports share."""
+    ports_by_part = {}
+    for track in mid.tracks:
+        port = 0
+        for _, status, data in track.events():
+            if _is_port_event(status, data):
+                port = data[1]
+            elif status < 0xF0:
+                ports_by_part.setdefault((unit_for_port(port, units), status & 0x0F), set()).add(port)
+    return [(unit, channel, sorted(ports)) for (unit, channel), ports in sorted(ports_by_part.items())
+            if len(ports) > 1]
+
+def _track_setup(track, units):
+    """Returns (unit, channel, program) of a track's first program change, or Nones."""
+    unit = 0
+    track_unit = 0
+    track_channel = None
+    
+    for _, status, data in track.events():
+        if _is_port_event(status, data):
+            unit = unit_for_port(data[1], units)
+        elif status < 0xF0:
+            track_channel = status & 0x0F  # Get channel from first channel message
+            track_unit = unit
+            if status & 0xF0 == 0xC0:
+                return track_unit, track_channel, data[0]
+    return track_unit, track_channel, None
+
+def advance_channel_state(track, channel_program_maps, part_setup=None, mapping=None):
+    """Applies a PackedTrack's part selections to the channel maps without converting it.
+
+    Makes exactly the decisions convert_track() makes, so it can compute the
+    channel state each track starts with ahead of a parallel conversion.
+    """
+    units = len(channel_program_maps)
+    track_unit, track_channel, track_program = _track_setup(track, units)
+    if track_channel is not None and track_program is not None:
+        target = select_program(channel_program_maps[track_unit], track_channel, track_program, leading=True)
+        if target is not None:
+            channel_program_maps[track_unit][track_channel] = target[:3]
+            if part_setup is not None:
+                part_setup.setdefault(track_unit, {})[track_channel] = target[:3]
+            if mapping is not None:
+                mapping.setdefault((track_unit, track_channel), set()).add(target)
+    
+    unit = 0
+    for _, status, data in track.events():
+        if _is_port_event(status, data):
+            unit = unit_for_port(data[1], units)
+        elif status & 0xF0 == 0xC0 and status < 0xF0:
+            channel = status & 0x0F
+            target = select_program(channel_program_maps[unit], channel, data[0])
+            if target is not None:
+                channel_program_maps[unit][channel] = target[:3]
+                if mapping is not None:
+                    mapping.setdefault((unit, channel), set()).add(target)
+
+def convert_track(track, channel_program_maps, device_ids=(DEVICE_ID,), part_setup=None, mapping=None):
+    """Converts one PackedTrack and returns the output PackedTrack.
+
+    ``channel_program_maps`` holds the part state per unit when the track
+    starts and is updated in place; ``part_setup`` and ``mapping`` work as
+    in convert_midi().
+    """
+    blind_setup = part_setup is None
+    if mapping is None:
+        mapping = {}
+    units = len(device_ids)
+    output_track = PackedTrack()
+    
+    # Find the port, channel and program for this track
+    track_unit, track_channel, track_program = _track_setup(track, units)
+    
+    # Set the part up at the start of the track; the program change itself
+    # is then a no-op when the main loop reaches it, so timing is preserved
+    if track_channel is not None and track_program is not None:
+        target = select_program(channel_program_maps[track_unit], track_channel, track_program, leading=True)
+        if target is not None:
+            msb, lsb, program_num, label = target
+            print(f"Setting channel {track_channel}: {label} (Program {program_num})")
+            if blind_setup:
+                set_bank_and_program(output_track, track_channel, msb, lsb, program_num,
+                                     device_id=device_ids[track_unit])
+            else:
+                part_setup.setdefault(track_unit, {})[track_channel] = (msb, lsb, program_num)
+            channel_program_maps[track_unit][track_channel] = (msb, lsb, program_num)
+            mapping.setdefault((track_unit, track_channel), set()).add(target)
+    
+    # Process all messages in the track
+    unit = 0
+    channel_program_map = channel_program_maps[unit]
+    last_time = 0
+    for delta, status, data in track.events():
+        if status < 0xF0:
+            kind = status & 0xF0
+            # Skip bank select messages as we handle them with program changes
+            if kind == 0xB0 and data[0] in (0, 32):
+                last_time += delta
+                continue
+            if kind == 0xC0:
+                channel = status & 0x0F
+                program = data[0]
+                last_time += delta
+                target = select_program(channel_program_map, channel, program)
+                if channel == DRUM_CHANNEL:
+                    current_program = channel_program_map.get(channel, (None, None, None))[2]
+                    print(f"Drum program change request: Input={program}, Current={current_program}")
+                if target is not None:
+                    msb, lsb, program_num, label = target
+                    print(f"Mid-track change on channel {channel} to {label} (Program {program_num})")
+                    # Accumulated time rides on the first message of the block
+                    set_bank_and_program(output_track, channel, msb, lsb, program_num, time=last_time,
+                                         device_id=device_ids[unit])
+                    channel_program_map[channel] = (msb, lsb, program_num)
+                    mapping.setdefault((unit, channel), set()).add(target)
+                    last_time = 0
+                elif channel == DRUM_CHANNEL:
+                    print(f"Skipping drum program change - already using program {current_program}")
+                continue
+            # Copy all other channel messages (notes, controllers, etc.)
+            output_track.append_event(last_time + delta, status, data)
+            last_time = 0
+        else:
+            # Pass through non-channel messages (like meta messages)
+            if _is_port_event(status, data):
+                unit = unit_for_port(data[1], units)
+                channel_program_map = channel_program_maps[unit]
+                if units > 1:
+                    data = bytes([MIDI_PORT_META, unit])
+            output_track.append_event(last_time + delta, status, data)
+            last_time = 0
+    
+    return output_track
+
+def _convert_track_job(job):
+    """Process pool worker: converts one track from a precomputed channel state."""
+    track, channel_program_maps, device_ids, blind_setup = job
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        output_track = convert_track(track, channel_program_maps, device_ids,
+                                     part_setup=None if blind_setup else {})
+    return output_track, log.getvalue()
+
+def convert_midi(mid, part_setup=None, device_ids=(DEVICE_ID,), mapping=None, jobs=1):
+    """Converts a loaded GM1 MidiFile or PackedMidiFile and returns the mapped file of the same kind.
+
+    Each of ``device_ids`` is one Integra-7 unit. If given as dicts, ``part_setup`` collects the
+    part set-up needed before the first note ({unit: {part: (msb, lsb, program)}}) instead of
+    writing it, and ``mapping`` collects every part selection per (unit, channel).
+    """
+    packed_input = isinstance(mid, PackedMidiFile)
+    if not packed_input:
+        mid = PackedMidiFile.from_midi_file(mid)
+    output_mid = PackedMidiFile(mid.ticks_per_beat, list(
+        iter_converted_tracks(mid, part_setup, device_ids, mapping, jobs)))
+    return output_mid if packed_input else output_mid.to_midi_file()
+
+def iter_converted_tracks(mid, part_setup=None, device_ids=(DEVICE_ID,), mapping=None, jobs=1):
+    """Checks ports and builds the init tracks, then returns a generator converting each track on demand."""
+    blind_setup = part_setup is None
+    if mapping is None:
+        mapping = {}
+    units = len(device_ids)
+    collisions = port_collisions(mid, units)
+    if collisions:
+        shared = "; ".join(f"ports {', '.join(map(str, ports))} on unit {unit} channel {channel + 1}"
+                           for unit, channel, ports in collisions)
+        if units > 1:
+            raise ValueError(f"source ports would share parts: {shared}")
+        print(f"Warning: source ports share parts: {shared}")
+    init_tracks = []
+    
+    # Keep track of which channels have been assigned to which programs, per unit
+    channel_program_maps = [{} for _ in range(units)]
+    
+    for unit, device_id in enumerate(device_ids):
+        # Create initialization track
+        init_track = PackedTrack()
+        init_tracks.append(init_track)
+        if units > 1:
+            print(f"\nInitializing unit {unit} (device ID 0x{device_id:02X})")
+            init_track.append(mido.MetaMessage('midi_port', port=unit))
+        channel_program_map = channel_program_maps[unit]
+        
+        # First initialize the drum channel to ensure it's set up correctly from the start
+        print(f"Initializing drum channel {DRUM_CHANNEL}")
+        initialize_part(init_track, DRUM_CHANNEL)
+        
+        if blind_setup:
+            # Set up drum channel with GM2 Standard Kit
+            print(f"Setting up drum channel {DRUM_CHANNEL} with GM2 Standard Kit")
+            # Set bank type to PCM Synth via SysEx
+            part_address = STUDIO_SET_PART_BASE + (DRUM_CHANNEL * PART_OFFSET) + TONE_BANK_TYPE
+            init_track.append(create_sysex(part_address, [0], device_id=device_id))  # Type 0 = PCM Synth
+            init_track.append(mido.Message('note_on', note=0, velocity=0, time=SETTLE_TICKS))
+            
+            # Set to GM2 Standard Kit with correct MSB/LSB
+            set_bank_and_program(init_track, DRUM_CHANNEL, GM2_DRUM_MSB, GM2_LSB, 0,  # Using GM2_DRUM_MSB (120) and GM2_LSB (0)
+                                 device_id=device_id)
+        else:
+            part_setup.setdefault(unit, {})[DRUM_CHANNEL] = (GM2_DRUM_MSB, GM2_LSB, 0)
+        channel_program_map[DRUM_CHANNEL] = (GM2_DRUM_MSB, GM2_LSB, 0)
+        mapping.setdefault((unit, DRUM_CHANNEL), set()).add((GM2_DRUM_MSB, GM2_LSB, 0, "GM2 Kit 0"))
+        
+        # Initialize all other parts
+        for part in range(16):
+            if part != DRUM_CHANNEL:  # Skip drum channel as it's already initialized
+                print(f"Initializing part {part}")
+                initialize_part(init_track, part)
+    
+    def tracks():
+        yield from init_tracks
+        # Process each track
+        if jobs > 1 and len(mid.tracks) > 1:
+            # Phase 1: the channel state each track starts with is all the tracks share
+            jobs_args = []
+            for track in mid.tracks:
+                jobs_args.append((track, copy.deepcopy(channel_program_maps), device_ids, blind_setup))
+                advance_channel_state(track, channel_program_maps, part_setup, mapping)
+            # Phase 2: rewrite the tracks in parallel, keeping their order and logs
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for i, (output_track, log) in enumerate(pool.map(_convert_track_job, jobs_args)):
+                    print(f"\nProcessing track {i+1}/{len(mid.tracks)}")
+                    print(log, end='')
+                    yield output_track
+        else:
+            for i, track in enumerate(mid.tracks):
+                print(f"\nProcessing track {i+1}/{len(mid.tracks)}")
+                yield convert_track(track, channel_program_maps, device_ids, part_setup, mapping)
+    
+    return tracks()
+
+def map_gm1_to_supernatural(input_midi_path, output_midi_path, device_ids=(DEVICE_ID,), jobs=1):
+    """Maps a GM1 MIDI file to use Supernatural sounds.
+
+    Returns (mapping, error): the part selections made (see convert_midi())
+    and None on success, or None and the error message on failure.
+    """
     print(f"Opening input MIDI file: {input_midi_path}")
     try:
-        mid = mido.MidiFile(input_midi_path)
+        mid = read_packed_midi(input_midi_path)
         print(f"Successfully opened MIDI file with {len(mid.tracks)} tracks")
         
         # Debug: Print all messages affecting channel 9 in input file
         print("\nAnalyzing input file for channel 9 messages:")
         for i, track in enumerate(mid.tracks):
             track_has_ch9 = False
-            for msg in track:
-                if hasattr(msg, 'channel') and msg.channel == DRUM_CHANNEL:
+            for _, status, data in track.events():
+                if status < 0xF0 and status & 0x0F == DRUM_CHANNEL:
                     if not track_has_ch9:
                         print(f"\nTrack {i+1}:")
                         track_has_ch9 = True
-                    if msg.type == 'program_change':
-                        print(f"  Program Change to {msg.program}")
-                    elif msg.type == 'control_change':
-                        if msg.control == 0:
-                            print(f"  Bank Select MSB: {msg.value}")
-                        elif msg.control == 32:
-                            print(f"  Bank Select LSB: {msg.value}")
-                        elif msg.control == 121:
+                    kind = status & 0xF0
+                    if kind == 0xC0:
+                        print(f"  Program Change to {data[0]}")
+                    elif kind == 0xB0:
+                        if data[0] == 0:
+                            print(f"  Bank Select MSB: {data[1]}")
+                        elif data[0] == 32:
+                            print(f"  Bank Select LSB: {data[1]}")
+                        elif data[0] == 121:
                             print(f"  Reset All Controllers")
-                        elif msg.control == 123:
+                        elif data[0] == 123:
                             print(f"  All Notes Off")
-                    elif msg.type == 'note_on' and msg.velocity > 0:
-                        print(f"  First note: {msg.note}")
+                    elif kind == 0x90 and data[1] > 0:
+                        print(f"  First note: {data[0]}")
                         break
-                elif msg.type == 'sysex':
+                elif status == 0xF0:
                     # Check if it's a bank type change for channel 9
-                    if len(msg.data) >= 7:
-                        addr = (msg.data[4] << 16) | (msg.data[5] << 8) | msg.data[6]
+                    if len(data) >= 8:
+                        addr = (data[4] << 16) | (data[5] << 8) | data[6]
                         part_addr = STUDIO_SET_PART_BASE + (DRUM_CHANNEL * PART_OFFSET) + TONE_BANK_TYPE
                         if addr == part_addr:
-                            print(f"  SysEx Bank Type Change: {msg.data[7]}")
+                            print(f"  SysEx Bank Type Change: {data[7]}")
     except Exception as e:
         print(f"Error opening MIDI file: {e}")
-        return
+        return None, f"Error opening MIDI file: {e or type(e).__name__}"
 
-    output_mid = mido.MidiFile(ticks_per_beat=mid.ticks_per_beat)
-    
-    # Create initialization track
-    init_track = mido.MidiTrack()
-    output_mid.tracks.append(init_track)
-    
-    # Keep track of which channels have been assigned to which programs
-    channel_program_map = {}
-    
-    # First initialize the drum channel to ensure it's set up correctly from the start
-    print(f"Initializing drum channel {DRUM_CHANNEL}")
-    initialize_part(init_track, DRUM_CHANNEL)
-    
-    # Set up drum channel with GM2 Standard Kit
-    print(f"Setting up drum channel {DRUM_CHANNEL} with GM2 Standard Kit")
-    # Set bank type to PCM Synth via SysEx
-    part_address = STUDIO_SET_PART_BASE + (DRUM_CHANNEL * PART_OFFSET) + TONE_BANK_TYPE
-    init_track.append(create_sysex(part_address, [0]))  # Type 0 = PCM Synth
-    init_track.append(mido.Message('note_on', note=0, velocity=0, time=10))
-    
-    # Set to GM2 Standard Kit with correct MSB/LSB
-    set_bank_and_program(init_track, DRUM_CHANNEL, GM2_DRUM_MSB, GM2_LSB, 0)  # Using GM2_DRUM_MSB (120) and GM2_LSB (0)
-    channel_program_map[DRUM_CHANNEL] = (GM2_DRUM_MSB, GM2_LSB, 0)
-    
-    # Initialize all other parts
-    for part in range(16):
-        if part != DRUM_CHANNEL:  # Skip drum channel as it's already initialized
-            print(f"Initializing part {part}")
-            initialize_part(init_track, part)
-    
-    # Process each track
-    for i, track in enumerate(mid.tracks):
-        print(f"\nProcessing track {i+1}/{len(mid.tracks)}")
-        output_track = mido.MidiTrack()
-        output_mid.tracks.append(output_track)
-        
-        # Find the channel and program for this track
-        track_channel = None
-        track_program = None
-        cumulative_time = 0
-        
-        for msg in track:
-            if hasattr(msg, 'channel'):
-                track_channel = msg.channel  # Get channel from first channel message
-                if msg.type == 'program_change':
-                    track_program = msg.program
-                    break
-            cumulative_time += msg.time
-        
-        # Reset position for actual processing
-        if track_channel is not None and cumulative_time > 0:
-            # Add the cumulative time to the first message to preserve timing
-            output_track.append(mido.Message('note_on', note=0, velocity=0, time=cumulative_time))
-        
-        if track_channel is not None:
-            # For drum channel, only set it up if it hasn't been initialized yet
-            if track_channel == DRUM_CHANNEL:
-                if track_program is not None and track_channel not in channel_program_map:
-                    if track_program in SN_DRUM_KITS:
-                        print(f"Setting drum channel {track_channel} to SN-D {SN_DRUM_KITS[track_program]} (Kit {track_program})")
-                        set_bank_and_program(output_track, track_channel, SN_DRUM_MSB, SN_DRUM_LSB, track_program)
-                        channel_program_map[track_channel] = (SN_DRUM_MSB, SN_DRUM_LSB, track_program)
-                    else:
-                        gm2_program = GM2_DRUM_MAP.get(track_program, 0)  # Default to Standard Kit if no mapping
-                        print(f"Using GM2 Kit {gm2_program} for drum program {track_program}")
-                        set_bank_and_program(output_track, track_channel, GM2_DRUM_MSB, GM2_LSB, gm2_program)
-                        channel_program_map[track_channel] = (GM2_DRUM_MSB, GM2_LSB, gm2_program)
-            # For non-drum channels, only process if we found a program change
-            elif track_program is not None:
-                if track_program in SUPERNATURAL_MAP:
-                    program_num, tone_name = SUPERNATURAL_MAP[track_program]
-                    
-                    if tone_name == "GM2":
-                        msb = GM2_MSB
-                        lsb = GM2_LSB
-                        program_num = track_program  # Use original program number for GM2
-                    else:
-                        category = TONE_CATEGORY[tone_name]
-                        msb = BANK_MSB[category]
-                        lsb = BANK_LSB[category]
-                    
-                    # Only update if different from current program
-                    if (track_channel not in channel_program_map or 
-                        channel_program_map[track_channel] != (msb, lsb, program_num)):
-                        print(f"Setting channel {track_channel}: {tone_name} (Program {program_num})")
-                        set_bank_and_program(output_track, track_channel, msb, lsb, program_num)
-                        channel_program_map[track_channel] = (msb, lsb, program_num)
-        
-        # Process all messages in the track
-        last_time = 0
-        for msg in track:
-            if hasattr(msg, 'channel'):
-                # Skip bank select messages as we handle them with program changes
-                if msg.type == 'control_change' and msg.control in [0, 32]:
-                    last_time += msg.time
-                    continue
-                if msg.type == 'program_change':
-                    # For drum channel, only handle program changes if they map to a different kit
-                    if msg.channel == DRUM_CHANNEL:
-                        # Get the target GM2 program number
-                        target_program = msg.program if msg.program in SN_DRUM_KITS else GM2_DRUM_MAP.get(msg.program, 0)
-                        current_program = channel_program_map.get(msg.channel, (None, None, None))[2]
-                        
-                        print(f"Drum program change request: Input={msg.program}, Maps to={target_program}, Current={current_program}")
-                        
-                        # Only update if the target program is different from current
-                        if target_program != current_program:
-                            # Add accumulated time before program change
-                            if last_time > 0:
-                                output_track.append(mido.Message('note_on', note=0, velocity=0, time=last_time))
-                                last_time = 0
-                                
-                            if msg.program in SN_DRUM_KITS:
-                                print(f"Mid-track drum change to SN-D {SN_DRUM_KITS[msg.program]} (Kit {msg.program})")
-                                set_bank_and_program(output_track, msg.channel, SN_DRUM_MSB, SN_DRUM_LSB, msg.program)
-                                channel_program_map[msg.channel] = (SN_DRUM_MSB, SN_DRUM_LSB, msg.program)
-                            else:
-                                print(f"Mid-track drum change to GM2 Kit {target_program}")
-                                set_bank_and_program(output_track, msg.channel, GM2_DRUM_MSB, GM2_LSB, target_program)
-                                channel_program_map[msg.channel] = (GM2_DRUM_MSB, GM2_LSB, target_program)
-                        else:
-                            print(f"Skipping drum program change - already using program {current_program}")
-                            last_time += msg.time
-                    elif msg.program in SUPERNATURAL_MAP:
-                        program_num, tone_name = SUPERNATURAL_MAP[msg.program]
-                        
-                        if tone_name == "GM2":
-                            msb = GM2_MSB
-                            lsb = GM2_LSB
-                            program_num = msg.program
-                        else:
-                            category = TONE_CATEGORY[tone_name]
-                            msb = BANK_MSB[category]
-                            lsb = BANK_LSB[category]
-                        
-                        # Only update if different from current program
-                        if (msg.channel not in channel_program_map or 
-                            channel_program_map[msg.channel] != (msb, lsb, program_num)):
-                            # Add accumulated time before program change
-                            if last_time > 0:
-                                output_track.append(mido.Message('note_on', note=0, velocity=0, time=last_time))
-                                last_time = 0
-                                
-                            print(f"Mid-track change to {tone_name} (Program {program_num})")
-                            set_bank_and_program(output_track, msg.channel, msb, lsb, program_num)
-                            channel_program_map[msg.channel] = (msb, lsb, program_num)
-                        else:
-                            last_time += msg.time
-                    continue
-                else:
-                    # Copy all other channel messages (notes, controllers, etc.)
-                    new_msg = msg.copy()
-                    new_msg.time = last_time + msg.time
-                    output_track.append(new_msg)
-                    last_time = 0
-            else:
-                # Pass through non-channel messages (like meta messages)
-                new_msg = msg.copy()
-                new_msg.time = last_time + msg.time
-                output_track.append(new_msg)
-                last_time = 0
+    mapping = {}
+    try:
+        output_tracks = iter_converted_tracks(mid, device_ids=device_ids, mapping=mapping, jobs=jobs)
+    except ValueError as e:
+        print(f"Error converting MIDI file: {e}")
+        return None, f"Error converting MIDI file: {e}"
     
+    # Each track is converted as write_smf() gets to it
     print(f"\nSaving output MIDI file to: {output_midi_path}")
     try:
-        output_mid.save(output_midi_path)
+        write_smf(output_midi_path, output_tracks, mid.ticks_per_beat)
         print("Successfully saved mapped MIDI file")
-    except Exception as e:
+    except OSError as e:
         print(f"Error saving MIDI file: {e}")
+        return None, f"Error saving MIDI file: {e or type(e).__name__}"
+    except Exception as e:
+        # Raised by a track conversion while the file was being written
+        print(f"Error converting MIDI file: {e}")
+        return None, f"Error converting MIDI file: {e or type(e).__name__}"
+    return mapping, None
 
-if __name__ == "__main__":
+# --- Compact SMF Writing ---
+def _encode_varlen(value):
+    """Encodes a MIDI variable-length quantity in the fewest bytes."""
+    encoded = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        encoded.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(encoded)
+
+def _write_track_chunk(f, track):
+    """Streams one MTrk chunk to ``f`` and back-patches its length.
+
+    Channel messages use running status. Filler note_on note=0 velocity=0
+    events on channel 1 are dropped and their delta carried to the next
+    event, unless note 0 is actually sounding on that channel. End of track
+    is written exactly once, at the end. ``track`` is a PackedTrack or a
+    mido track.
+    """
+    if isinstance(track, PackedTrack):
+        events = track.events()
+    else:
+        events = ((msg.time, *_message_event(msg)) for msg in track)
+    f.write(b'MTrk\x00\x00\x00\x00')
+    start = f.tell()
+    running_status = None
+    pending = 0
+    note_zero_on = False
+    for delta, status, data in events:
+        pending += delta
+        if status == 0xFF:
+            if data[0] == 0x2F:
+                continue  # End of track
+            f.write(_encode_varlen(pending))
+            f.write(b'\xff' + data[:1] + _encode_varlen(len(data) - 1) + data[1:])
+            running_status = None
+        elif status in (0xF0, 0xF7):
+            f.write(_encode_varlen(pending))
+            f.write(bytes([status]) + _encode_varlen(len(data)) + data)
+            running_status = None
+        else:
+            if status == 0x90 and data[0] == 0:
+                if data[1] == 0 and not note_zero_on:
+                    continue  # Filler: keep its delta for the next event
+                note_zero_on = data[1] > 0
+            elif status == 0x80 and data[0] == 0:
+                note_zero_on = False
+            f.write(_encode_varlen(pending))
+            if status != running_status:
+                f.write(bytes([status]))
+                running_status = status
+            f.write(data)
+        pending = 0
+    f.write(_encode_varlen(pending) + b'\xff\x2f\x00')
+    end = f.tell()
+    f.seek(start - 4)
+    f.write((end - start).to_bytes(4, 'big'))
+    f.seek(end)
+
+def write_smf(path, tracks, ticks_per_beat):
+    """Writes a format 1 Standard MIDI File one track at a time.
+
+    ``tracks`` may be any iterable of message iterables, so tracks can be
+    produced while the file is written; the track count in the header is
+    back-patched at the end. The file is written next to ``path`` and only
+    replaces it once complete, so a failure never leaves a partial file.
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big')
+                    + b'\x00\x00' + ticks_per_beat.to_bytes(2, 'big'))
+            track_count = 0
+            for track in tracks:
+                _write_track_chunk(f, track)
+                track_count += 1
+            f.seek(10)
+            f.write(track_count.to_bytes(2, 'big'))
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+# --- Lazy SMF Reading ---
+def read_smf_header(f):
+    """Reads the MThd chunk and returns (format, track_count, ticks_per_beat)."""
+    chunk_id = f.read(4)
+    if chunk_id != b'MThd':
+        raise ValueError("not a Standard MIDI File (missing MThd)")
+    length = int.from_bytes(f.read(4), 'big')
+    header = f.read(length)
+    if len(header) < 6:
+        raise ValueError("truncated MThd chunk")
+    return (int.from_bytes(header[0:2], 'big'),
+            int.from_bytes(header[2:4], 'big'),
+            int.from_bytes(header[4:6], 'big'))
+
+def iter_track_chunks(f):
+    """Yields (offset, length) of each MTrk chunk without reading its contents."""
+    f.seek(0)
+    read_smf_header(f)
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return
+        length = int.from_bytes(chunk_header[4:8], 'big')
+        offset = f.tell()
+        if chunk_header[:4] == b'MTrk':
+            yield offset, length
+        f.seek(offset + length)
+
+def _read_varlen(read):
+    """Reads a MIDI variable-length quantity."""
+    value = 0
+    while True:
+        byte = read(1)
+        if not byte:
+            raise ValueError("truncated variable-length quantity")
+        value = (value << 7) | (byte[0] & 0x7F)
+        if not byte[0] & 0x80:
+            return value
+
+def iter_track_events(f, offset, length):
+    """Lazily decodes one MTrk chunk, yielding (delta, status, data) tuples.
+
+    Running status is resolved, so ``status`` is always a full status byte.
+    Meta events use status 0xFF with data = type byte + payload; SysEx uses
+    0xF0/0xF7 with the stored payload. Only one event is held at a time.
+    """
+    f.seek(offset)
+    read = f.read
+    end = offset + length
+    running_status = None
+    while f.tell() < end:
+        delta = _read_varlen(read)
+        byte = read(1)
+        if not byte:
+            raise ValueError("truncated track chunk")
+        status = byte[0]
+        if status == 0xFF:
+            meta_type = read(1)
+            data = meta_type + read(_read_varlen(read))
+        elif status in (0xF0, 0xF7):
+            data = read(_read_varlen(read))
+        else:
+            if status & 0x80:
+                running_status = status
+                data = read(1)
+            elif running_status is None:
+                raise ValueError("data byte without running status")
+            else:
+                data = byte
+                status = running_status
+            if status & 0xF0 not in (0xC0, 0xD0):
+                data += read(1)
+        yield delta, status, data
+
+# --- Round-trip Verification ---
+FILLER_DATA = b'\x00\x00'  # note_on note=0 velocity=0, used as a delay filler
+INSERTED_CONTROLS = (121, 123)  # Reset All Controllers / All Notes Off from set_bank_and_program
+SYSEX_ADDRESS_MASK = 0xFFFFFF  # create_sysex sends three address bytes
+
+def parse_sysex(data):
+    """Decodes a create_sysex() payload into (device_id, command, address, values).
+
+    Returns None for anything that is not a checksum-valid Roland Integra-7 message.
+    """
+    data = bytes(data)
+    if data.endswith(b'\xf7'):
+        data = data[:-1]
+    if len(data) < 8 or data[0] != MANUFACTURER_ID or data[2] != MODEL_ID:
+        return None
+    if sum(data[4:]) % 128 != 0:
+        return None
+    address = (data[4] << 16) | (data[5] << 8) | data[6]
+    return data[1], data[3], address, list(data[7:-1])
+
+def _bank_type_write(data):
+    """Returns (part, bank type) for a tone bank type write from set_bank_and_program, or None."""
+    parsed = parse_sysex(data)
+    if parsed is None or parsed[1] != COMMAND_DT1 or len(parsed[3]) != 1:
+        return None
+    offset = parsed[2] - (STUDIO_SET_PART_BASE & SYSEX_ADDRESS_MASK)
+    if not 0 <= offset < 16 * PART_OFFSET or offset % PART_OFFSET != TONE_BANK_TYPE:
+        return None
+    return offset // PART_OFFSET, parsed[3][0]
+
+def _is_filler_item(item):
+    """Checks whether an expected item is a note_on note=0 velocity=0 on channel 1."""
+    return item is not None and item[0] == 'event' and item[2] == 0x90 and item[3] == FILLER_DATA
+
+def _describe_item(item):
+    """Formats a verification item for the diff output."""
+    if item is None:
+        return "end of track"
+    if item[0] == 'program':
+        _, tick, channel, (msb, lsb, program) = item
+        return f"tick {tick}: program ch={channel} msb={msb} lsb={lsb} program={program}"
+    _, tick, status, data = item
+    if status == 0xFF:
+        return f"tick {tick}: meta 0x{data[0]:02X} {bytes(data[1:])!r}"
+    if status in (0xF0, 0xF7):
+        return f"tick {tick}: sysex {bytes(data).hex(' ')}"
+    msg = mido.Message.from_bytes([status, *data])
+    return f"tick {tick}: {str(msg).rsplit(' time=', 1)[0]}"
+
+MIDI_PORT_META = 0x21
+
+def _expected_items(f, chunk, channel_program_maps):
+    """Yields what the converter should produce for one input track.
+
+    Program changes become ('program', tick, channel, (msb, lsb, program))
+    items following the converter's own selection rules; bank selects are
+    dropped and everything else is an ('event', tick, status, data) item.
+    ``channel_program_maps`` holds one channel map per unit.
+    """
+    units = len(channel_program_maps)
+    unit = 0
+    leading = None
+    for _, status, data in iter_track_events(f, *chunk):
+        if status == 0xFF and data[0] == MIDI_PORT_META and len(data) > 1:
+            unit = unit_for_port(data[1], units)
+        elif 0xC0 <= status <= 0xCF:
+            leading = (unit, status & 0x0F, data[0])
+            break
+    if leading is not None:
+        leading_unit, channel, program = leading
+        target = select_program(channel_program_maps[leading_unit], channel, program, leading=True)
+        if target is not None:
+            channel_program_maps[leading_unit][channel] = target[:3]
+            yield ('program', 0, channel, target[:3])
+    
+    unit = 0
+    tick = 0
+    for delta, status, data in iter_track_events(f, *chunk):
+        tick += delta
+        if status < 0xF0:
+            kind = status & 0xF0
+            if kind == 0xB0 and data[0] in (0, 32):
+                continue
+            if kind == 0xC0:
+                channel = status & 0x0F
+                target = select_program(channel_program_maps[unit], channel, data[0])
+                if target is not None:
+                    channel_program_maps[unit][channel] = target[:3]
+                    yield ('program', tick, channel, target[:3])
+                continue
+        elif status == 0xFF and data[0] == MIDI_PORT_META and len(data) > 1:
+            unit = unit_for_port(data[1], units)
+            if units > 1:
+                data = bytes([MIDI_PORT_META, unit])
+        yield ('event', tick, status, data)
+
+def _in_block(head, source_tick, channel, offset=0):
+    """Checks whether an output event sits inside the block written for the expected program item.
+
+    set_bank_and_program() writes CC#121, CC#123 and the bank type SysEx at
+    the program change's tick, then a filler and the bank select and
+    program change SETTLE_TICKS later (``offset``).
+    """
+    return (head is not None and head[0] == 'program' and head[2] == channel
+            and head[1] + offset == source_tick)
+
+def _verify_track(in_f, in_chunk, out_f, out_chunk, channel_program_maps):
+    """Walks one input/output track pair in lockstep.
+
+    Returns (items_checked, settle_ticks, mismatch) where mismatch is None or
+    an (expected, got) pair of items. Ticks on the output side are compared
+    after removing the settle delays set_bank_and_program inserts: one
+    SETTLE_TICKS before and one after each program change it writes, whether
+    they are carried by filler events or folded into the next delta. The
+    events the converter inserts are only accepted inside such a block;
+    anywhere else they are differences.
+    """
+    expected = _expected_items(in_f, in_chunk, channel_program_maps)
+    head = next(expected, None)
+    checked = 0
+    tick = 0
+    settle = 0
+    last_block = None  # Source tick of the last block, where its closing filler sits
+    bank = {}
+    for delta, status, data in iter_track_events(out_f, *out_chunk):
+        tick += delta
+        source_tick = tick - settle
+        got = ('event', source_tick, status, data)
+        if status < 0xF0:
+            channel = status & 0x0F
+            kind = status & 0xF0
+            if kind == 0xB0 and data[0] in (0, 32):
+                if not _in_block(head, source_tick, channel, SETTLE_TICKS):
+                    return checked, settle, (head, got)
+                bank[(channel, data[0])] = data[1]
+                continue
+            if kind == 0xC0:
+                got = ('program', source_tick - SETTLE_TICKS, channel,
+                       (bank.get((channel, 0)), bank.get((channel, 32)), data[0]))
+                settle += 2 * SETTLE_TICKS
+                if got != head:
+                    return checked, settle, (head, got)
+                last_block = head[1]
+                checked += 1
+                head = next(expected, None)
+                continue
+            # A copy of an identical input event is checked like any other
+            if got != head:
+                if kind == 0xB0 and data[0] in INSERTED_CONTROLS and data[1] == 0:
+                    if _in_block(head, source_tick, channel):
+                        continue
+                elif status == 0x90 and data == FILLER_DATA:
+                    # Fillers are on channel 1 whatever part the block is for
+                    if head is not None and head[0] == 'program' and head[1] + SETTLE_TICKS == source_tick:
+                        continue
+                    if source_tick == last_block:
+                        continue
+        elif status == 0xF0 and got != head:
+            bank_type = _bank_type_write(data)
+            if bank_type is not None and head is not None and head[0] == 'program':
+                part, value = bank_type
+                if _in_block(head, source_tick, part) and value == TONE_BANK_TYPES.get(head[3][0]):
+                    continue
+        # A filler in the input may have been folded into a delta by write_smf()
+        while got != head and _is_filler_item(head):
+            head = next(expected, None)
+        if got != head:
+            return checked, settle, (head, got)
+        checked += 1
+        head = next(expected, None)
+    while _is_filler_item(head):
+        head = next(expected, None)
+    if head is not None:
+        return checked, settle, (head, None)
+    # Drain so the channel maps see every program change of this track
+    for _ in expected:
+        pass
+    return checked, settle, None
+
+def verify_conversion(input_midi_path, output_midi_path, max_diffs=10, units=1):
+    """Checks that a converted file differs from its input only in bank and program data.
+
+    Both files are streamed track by track with bounded memory. ``units``
+    must match the number of units the file was converted for. Returns a
+    list of human-readable differences (empty on success).
+    """
+    diffs = []
+    with open(input_midi_path, 'rb') as in_f, open(output_midi_path, 'rb') as out_f:
+        _, _, in_division = read_smf_header(in_f)
+        _, _, out_division = read_smf_header(out_f)
+        if in_division != out_division:
+            diffs.append(f"ticks_per_beat: expected {in_division}, got {out_division}")
+        in_chunks = list(iter_track_chunks(in_f))
+        out_chunks = list(iter_track_chunks(out_f))
+        if len(out_chunks) != len(in_chunks) + units:
+            diffs.append(f"track count: expected {len(in_chunks) + units} (with {units} init track(s)), "
+                         f"got {len(out_chunks)}")
+            return diffs
+        
+        # The init tracks set the drum channel up before any input track runs
+        channel_program_maps = [{DRUM_CHANNEL: (GM2_DRUM_MSB, GM2_LSB, 0)} for _ in range(units)]
+        total_checked = 0
+        total_settle = 0
+        for i, in_chunk in enumerate(in_chunks):
+            checked, settle, mismatch = _verify_track(
+                in_f, in_chunk, out_f, out_chunks[i + units], channel_program_maps)
+            total_checked += checked
+            total_settle += settle
+            if mismatch is not None:
+                expected, got = mismatch
+                diffs.append(f"track {i+1}: expected {_describe_item(expected)}; "
+                             f"got {_describe_item(got)}")
+                if len(diffs) >= max_diffs:
+                    diffs.append("... (further differences not shown)")
+                    break
+    if not diffs:
+        print(f"OK: {total_checked} events verified across {len(in_chunks)} tracks "
+              f"({total_settle} ticks of settle delay inserted)")
+    return diffs
+
+# --- Mapping Plan ---
+def plan_file(input_midi_path, max_ticks=None, units=1):
+    """Works out which part each track will be set to, without converting the file.
+
+    Each track is read lazily only until its first program change (or
+    ``max_ticks``), which is all the converter's track set-up depends on.
+    Returns a JSON-friendly dict with one entry per track and the part
+    selections once every track's first program change has been applied.
+    """
+    tracks = []
+    channel_program_maps = [{DRUM_CHANNEL: (GM2_DRUM_MSB, GM2_LSB, 0)} for _ in range(units)]
+    with open(input_midi_path, 'rb') as f:
+        _, track_count, ticks_per_beat = read_smf_header(f)
+        for i, chunk in enumerate(list(iter_track_chunks(f))):
+            unit = 0
+            track_unit = 0
+            channel = None
+            program = None
+            tick = 0
+            for delta, status, data in iter_track_events(f, *chunk):
+                tick += delta
+                if max_ticks is not None and tick > max_ticks:
+                    break
+                if status == 0xFF and data[0] == MIDI_PORT_META and len(data) > 1:
+                    unit = unit_for_port(data[1], units)
+                elif status < 0xF0:
+                    channel = status & 0x0F
+                    track_unit = unit
+                    if status & 0xF0 == 0xC0:
+                        program = data[0]
+                        break
+            entry = {'track': i + 1, 'channel': channel, 'program': program}
+            if units > 1:
+                entry['unit'] = track_unit
+            if channel is not None and program is not None:
+                # The drum channel is already set up by the init track, so the
+                # converter switches its kit when it reaches the program change
+                target = (select_program(channel_program_maps[track_unit], channel, program, leading=True)
+                          or select_program(channel_program_maps[track_unit], channel, program))
+                if target is not None:
+                    channel_program_maps[track_unit][channel] = target[:3]
+                msb, lsb, program_num, label = map_program(channel, program)
+                entry.update(bank=BANK_NAMES.get(msb, "?"), msb=msb, lsb=lsb,
+                             target_program=program_num, tone=label)
+            tracks.append(entry)
+    
+    parts = {}
+    for unit, channel_program_map in enumerate(channel_program_maps):
+        for channel, (msb, lsb, program_num) in sorted(channel_program_map.items()):
+            key = f"{unit}:{channel}" if units > 1 else str(channel)
+            parts[key] = {'bank': BANK_NAMES.get(msb, "?"), 'msb': msb, 'lsb': lsb,
+                          'program': program_num, 'drums': channel == DRUM_CHANNEL}
+    return {'file': input_midi_path, 'ticks_per_beat': ticks_per_beat,
+            'track_count': track_count, 'tracks': tracks, 'parts': parts}
+
+def plan_main(argv):
+    """Entry point for the ``plan`` subcommand."""
     parser = argparse.ArgumentParser(
-        description='Convert GM1 MIDI file to use Integra-7 Supernatural sounds')
+        prog='gm1tosn.py plan',
+        description='Print the SuperNATURAL/GM2 mapping plan of MIDI files as JSON Lines without converting them')
     parser.add_argument('input_files', nargs='+', help='Input MIDI file(s) or pattern(s)')
+    parser.add_argument('--max-ticks', type=int,
+                        help='Stop reading a track after this many ticks without a program change')
+    parser.add_argument('--units', type=int, default=1,
+                        help='Number of Integra-7 units to plan for (default: 1)')
+    parser.add_argument('-o', '--output', help='Write the plan to this file instead of stdout')
+    args = parser.parse_args(argv)
     
-    args = parser.parse_args()
+    out = open(args.output, 'w') if args.output else sys.stdout
+    failed = 0
+    try:
+        for input_file in expand_input_files(args.input_files):
+            try:
+                plan = plan_file(input_file, args.max_ticks, args.units)
+            except (OSError, ValueError) as e:
+                failed += 1
+                plan = {'file': input_file, 'error': str(e)}
+            out.write(json.dumps(plan) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+# --- Device Readback ---
+def create_data_request(address, size, device_id=DEVICE_ID):
+    """Creates an RQ1 message asking the unit for ``size`` bytes at ``address``.
+
+    The framing follows create_sysex(): three address bytes and a size in
+    three 7-bit groups. The Integra-7 documents four-byte address and size
+    fields, so this has only been checked against integra7_sim, which
+    shares these helpers.
+    """
+    return create_sysex(address, [(size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F],
+                        command=COMMAND_RQ1, device_id=device_id)
+
+def part_base_address(part):
+    """Returns the address of a Studio Set part as create_sysex() sends it."""
+    return (STUDIO_SET_PART_BASE + part * PART_OFFSET) & SYSEX_ADDRESS_MASK
+
+def read_part_block(inport, outport, part, timeout=0.2, retries=2, device_id=DEVICE_ID):
+    """Reads a Studio Set part block back from the unit with RQ1.
+
+    DT1 replies are matched by address, so a reply split over several
+    messages is reassembled. Replies with a bad checksum are ignored and the
+    request is retried after ``timeout`` seconds, up to ``retries`` times.
+    Returns {offset: value} and raises TimeoutError if the unit never answers.
+    """
+    address = part_base_address(part)
+    request = create_data_request(address, PART_BLOCK_SIZE, device_id)
+    for attempt in range(retries + 1):
+        if attempt:
+            print(f"No complete reply for part {part}, retrying ({attempt}/{retries})")
+        outport.send(request)
+        values = {}
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            msg = inport.poll()
+            if msg is None:
+                time.sleep(0.001)
+                continue
+            if msg.type != 'sysex':
+                continue
+            parsed = parse_sysex(msg.data)
+            if parsed is None:
+                continue
+            reply_device_id, command, reply_address, data = parsed
+            if reply_device_id != device_id or command != COMMAND_DT1:
+                continue
+            for i, value in enumerate(data):
+                offset = reply_address - address + i
+                if 0 <= offset < PART_BLOCK_SIZE:
+                    values[offset] = value
+            if len(values) == PART_BLOCK_SIZE:
+                return values
+    raise TimeoutError(f"Integra-7 0x{device_id:02X} did not answer data request for part {part}")
+
+def read_studio_set(inport, outport, parts=range(16), device_state=None, timeout=0.2, retries=2,
+                    device_id=DEVICE_ID):
+    """Reads the given parts into ``device_state`` ({part: {offset: value}}) and returns it.
+
+    Parts already present in ``device_state`` are not read again.
+    """
+    if device_state is None:
+        device_state = {}
+    for part in parts:
+        if part not in device_state:
+            device_state[part] = read_part_block(inport, outport, part, timeout, retries, device_id)
+    return device_state
+
+def studio_set_targets(part_setup):
+    """Turns {part: (msb, lsb, program)} into the part parameters it needs."""
+    return {
+        part: {
+            TONE_BANK_TYPE: TONE_BANK_TYPES.get(msb, 0),
+            TONE_BANK_MSB: msb,
+            TONE_BANK_LSB: lsb,
+            TONE_PC: program,
+        }
+        for part, (msb, lsb, program) in part_setup.items()
+    }
+
+TONE_SELECT = (TONE_BANK_MSB, TONE_BANK_LSB, TONE_PC)  # Sent as bank select and program change
+
+def studio_set_updates(device_state, targets, device_id=DEVICE_ID):
+    """Returns the messages needed to bring ``device_state`` to ``targets``.
+
+    Only parts and parameters that differ are included. Parameters go out as
+    DT1 messages, with changes to adjacent addresses sharing one message;
+    a changed tone is then selected the way set_bank_and_program() does it,
+    with bank select and program change on the part's receive channel.
+    """
+    messages = []
+    for part, params in sorted(targets.items()):
+        current = device_state.get(part, {})
+        # Parameters are kept in set-up order, bank type first
+        changed = [(offset, value) for offset, value in params.items()
+                   if offset not in TONE_SELECT and current.get(offset) != value]
+        run_start = None
+        run_values = []
+        for offset, value in changed:
+            if run_start is not None and offset == run_start + len(run_values):
+                run_values.append(value)
+                continue
+            if run_start is not None:
+                messages.append(create_sysex(part_base_address(part) + run_start, run_values,
+                                             device_id=device_id))
+            run_start = offset
+            run_values = [value]
+        if run_start is not None:
+            messages.append(create_sysex(part_base_address(part) + run_start, run_values,
+                                         device_id=device_id))
+        if any(offset in params and current.get(offset) != params[offset] for offset in TONE_SELECT):
+            channel = current.get(RECEIVE_CHANNEL, part)
+            messages.append(mido.Message('control_change', channel=channel, control=0,
+                                         value=params[TONE_BANK_MSB]))
+            messages.append(mido.Message('control_change', channel=channel, control=32,
+                                         value=params[TONE_BANK_LSB]))
+            messages.append(mido.Message('program_change', channel=channel, program=params[TONE_PC]))
+    return messages
+
+def send_studio_set_updates(outport, device_state, targets, settle=0.02, device_id=DEVICE_ID):
+    """Sends only the changed part parameters and records them in ``device_state``.
+
+    Returns the number of messages sent.
+    """
+    messages = studio_set_updates(device_state, targets, device_id)
+    for msg in messages:
+        outport.send(msg)
+    for part, params in targets.items():
+        device_state.setdefault(part, {}).update(params)
+    if messages:
+        # Give the unit time to load the new tones
+        time.sleep(settle)
+    return len(messages)
+
+def forget_changed_parts(device_state, channels, parts):
+    """Drops parts a song changed while playing from ``device_state``.
+
+    ``channels`` are the channels that received a bank select or program
+    change and ``parts`` the parts whose bank type was written. The next
+    song then reads those parts again, or sets them blind.
+    """
+    for part in list(device_state):
+        if part in parts or device_state[part].get(RECEIVE_CHANNEL, part) in channels:
+            del device_state[part]
+
+# --- Corpus Sharding ---
+def parse_shard(text):
+    """Parses a 1-based "i/N" shard spec into (i, N)."""
+    try:
+        index, shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, got {text!r}")
+    if not 1 <= index <= shards:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {shards}, got {index}")
+    return index, shards
+
+def file_digest(input_file):
+    """Returns the SHA-1 hex digest of a file's bytes."""
+    digest = hashlib.sha1()
+    with open(input_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def shard_key(input_file, key='path'):
+    """Returns a stable digest identifying a file for sharding.
+
+    'path' hashes the normalized path, so every node must see the corpus at
+    the same relative path; 'content' hashes the file bytes instead. A file
+    that cannot be read falls back to its path, so it still lands in exactly
+    one shard and is reported as failed there.
+    """
+    if key == 'content':
+        try:
+            return file_digest(input_file)
+        except OSError:
+            pass
+    return hashlib.sha1(os.path.normpath(input_file).replace(os.sep, '/').encode('utf-8')).hexdigest()
+
+def select_shard(input_files, index, shards, key='path'):
+    """Returns the sorted slice of ``input_files`` that belongs to shard ``index`` of ``shards``."""
+    return sorted(input_file for input_file in set(input_files)
+                  if int(shard_key(input_file, key)[:8], 16) % shards == index - 1)
+
+def mapping_summary(mapping):
+    """Turns a convert_midi() mapping into JSON-friendly {"unit:channel": [labels]}."""
+    return {
+        f"{unit}:{channel}": sorted(f"{label} ({msb}/{lsb}/{program})"
+                                    for msb, lsb, program, label in selections)
+        for (unit, channel), selections in sorted(mapping.items())
+    }
+
+def write_manifest(path, manifest):
+    """Writes a shard manifest atomically."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+def merge_reports_main(argv):
+    """Entry point for the ``merge-reports`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='gm1tosn.py merge-reports',
+        description='Combine per-shard conversion manifests into one report')
+    parser.add_argument('manifests', nargs='+', help='Shard manifest file(s) or pattern(s)')
+    parser.add_argument('-o', '--output', help='Write the merged report to this JSON file')
+    args = parser.parse_args(argv)
     
-    # Process each argument which could be a pattern or a file
+    shards = None
+    seen = {}
+    statuses = {}
+    files = []
+    for path in expand_input_files(args.manifests):
+        with open(path) as f:
+            manifest = json.load(f)
+        if shards is None:
+            shards = manifest['shards']
+        elif manifest['shards'] != shards:
+            print(f"Error: {path} is from a {manifest['shards']}-way split, expected {shards}")
+            return 1
+        if manifest['shard'] in seen:
+            print(f"Warning: shard {manifest['shard']}/{shards} appears in both "
+                  f"{seen[manifest['shard']]} and {path}; using {path}")
+            files = [entry for entry in files if entry['shard'] != manifest['shard']]
+        seen[manifest['shard']] = path
+        statuses[manifest['shard']] = manifest.get('status')
+        files.extend(dict(entry, shard=manifest['shard']) for entry in manifest['files'])
+    
+    missing = [index for index in range(1, (shards or 0) + 1) if index not in seen]
+    # A shard that was interrupted or is still running has not covered its slice
+    incomplete = sorted(index for index, status in statuses.items() if status not in ('ok', 'failed'))
+    failed = [entry for entry in files if entry['status'] != 'ok']
+    report = {
+        'shards': shards,
+        'missing_shards': missing,
+        'incomplete_shards': incomplete,
+        'files': len(files),
+        'ok': len(files) - len(failed),
+        'failed': len(failed),
+        'seconds': round(sum(entry['seconds'] for entry in files), 3),
+        'failures': failed,
+        'mapping': {},
+    }
+    for entry in files:
+        for part, labels in entry.get('mapping', {}).items():
+            for label in labels:
+                counts = report['mapping'].setdefault(part, {})
+                counts[label] = counts.get(label, 0) + 1
+    
+    print(f"Shards: {len(seen)}/{shards}" + (f" (missing {missing})" if missing else ""))
+    for index in incomplete:
+        print(f"  shard {index}: {statuses[index]} ({seen[index]}), re-run it with --shard {index}/{shards}")
+    print(f"Files: {report['files']} ({report['ok']} ok, {report['failed']} failed), "
+          f"{report['seconds']:.1f}s converting")
+    for entry in failed:
+        print(f"  shard {entry['shard']}: {entry['input']}: {entry.get('error')}")
+    if args.output:
+        write_manifest(args.output, report)
+        print(f"Merged report written to {args.output}")
+    return 1 if missing or incomplete or failed else 0
+
+def expand_input_files(patterns):
+    """Expands glob patterns (``**`` matches any depth), keeping non-matching arguments as literal paths."""
     input_files = []
-    for pattern in args.input_files:
+    for pattern in patterns:
         # Try to expand as a pattern first
-        matched_files = glob(pattern)
+        matched_files = glob(pattern, recursive=True)
         if matched_files:
             input_files.extend(matched_files)
         else:
             # If not a pattern, treat as a direct file path
             input_files.append(pattern)
+    return input_files
+
+def output_path_for(input_file):
+    """Generates the output filename by prepending "SN" to the input filename."""
+    input_dir = os.path.dirname(input_file)
+    input_basename = os.path.basename(input_file)
+    return os.path.join(input_dir, "SN" + input_basename)
+
+def verify_main(argv):
+    """Entry point for the ``verify`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='gm1tosn.py verify',
+        description='Verify that converted files only changed bank and program data')
+    parser.add_argument('input_files', nargs='+', help='Original input MIDI file(s) or pattern(s)')
+    parser.add_argument('--max-diffs', type=int, default=10,
+                        help='Maximum differences to report per file (default: 10)')
+    parser.add_argument('--units', type=int, default=1,
+                        help='Number of units the files were converted for (default: 1)')
+    args = parser.parse_args(argv)
+    
+    input_files = expand_input_files(args.input_files)
+    failed = 0
+    for input_file in input_files:
+        output_file = output_path_for(input_file)
+        print(f"\nVerifying {input_file} -> {output_file}")
+        try:
+            diffs = verify_conversion(input_file, output_file, args.max_diffs, args.units)
+        except (OSError, ValueError) as e:
+            diffs = [f"Error reading MIDI file: {e}"]
+        if diffs:
+            failed += 1
+            print("FAILED:")
+            for diff in diffs:
+                print(f"  {diff}")
+    
+    print(f"\nVerified {len(input_files) - failed}/{len(input_files)} file(s)")
+    return 1 if failed else 0
+
+def split_units(output_mid, units):
+    """Splits a converted PackedMidiFile per unit; tracks without channel messages go to every unit."""
+    unit_files = [PackedMidiFile(output_mid.ticks_per_beat) for _ in range(units)]
+    for i, track in enumerate(output_mid.tracks):
+        if i < units:
+            unit_files[i].tracks.append(track)
+        elif not any(status < 0xF0 for _, status, _ in track.events()):
+            for unit_file in unit_files:
+                unit_file.tracks.append(track)
+        else:
+            unit_files[unit_for_port(track_port(track), units)].tracks.append(track)
+    return unit_files
+
+# --- Scheduled Playback ---
+DEFAULT_TEMPO = 500000  # Microseconds per beat until the first set_tempo
+TEMPO_META = 0x51
+
+class ScheduledStream:
+    """One unit's ready-to-send messages at absolute times in seconds.
+
+    Message bytes are stored back to back in ``data`` with ``offsets``
+    marking where each one starts, as in PackedTrack, so a stream can go to
+    and from the playback cache without being parsed.
+    """
+    __slots__ = ('times', 'offsets', 'data')
+
+    def __init__(self, times=None, offsets=None, data=None):
+        self.times = array('d') if times is None else times
+        self.offsets = array('I', [0]) if offsets is None else offsets
+        self.data = bytearray() if data is None else data
+
+    def append(self, at, message):
+        """Appends the bytes of one message sent at ``at`` seconds."""
+        self.times.append(at)
+        self.data += message
+        self.offsets.append(len(self.data))
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        """Yields (time, message bytes) in send order."""
+        data = self.data
+        offsets = self.offsets
+        for i, at in enumerate(self.times):
+            yield at, data[offsets[i]:offsets[i + 1]]
+
+def _absolute_events(track):
+    """Yields (tick, status, data) for a PackedTrack, leaving out settle fillers."""
+    tick = 0
+    note_zero_on = False
+    for delta, status, data in track.events():
+        tick += delta
+        if status == 0x90 and data[0] == 0:
+            if data[1] == 0 and not note_zero_on:
+                continue  # Filler: only its timing matters
+            note_zero_on = data[1] > 0
+        elif status == 0x80 and data[0] == 0:
+            note_zero_on = False
+        yield tick, status, data
+
+def schedule_unit(unit_file):
+    """Flattens one unit's PackedMidiFile into a ScheduledStream.
+
+    Tracks are merged in time order the way mido plays them and tempo
+    changes are applied. Settle fillers are dropped, so the SysEx spacing
+    they carried is kept only in the message times. Meta events are not
+    sent.
+    """
+    stream = ScheduledStream()
+    ticks_per_beat = unit_file.ticks_per_beat
+    tempo_tick = 0
+    tempo_seconds = 0.0
+    seconds_per_tick = DEFAULT_TEMPO / (ticks_per_beat * 1e6)
+    events = heapq.merge(*(_absolute_events(track) for track in unit_file.tracks),
+                         key=lambda event: event[0])
+    for tick, status, data in events:
+        at = tempo_seconds + (tick - tempo_tick) * seconds_per_tick
+        if status == 0xFF:
+            if data[0] == TEMPO_META and len(data) == 4:
+                tempo_tick = tick
+                tempo_seconds = at
+                seconds_per_tick = int.from_bytes(data[1:], 'big') / (ticks_per_beat * 1e6)
+            continue
+        if status == 0xF7:
+            status = 0xF0  # Escaped SysEx is sent like mido sends it
+        stream.append(at, bytes([status]) + data)
+    return stream
+
+def _prepare_unit(stream):
+    """Decodes a ScheduledStream ahead of playback.
+
+    Returns the (time, mido message) pairs to send and the (channels, parts)
+    pair for forget_changed_parts(): the channels that get a bank select or
+    program change and the parts whose bank type is written.
+    """
+    messages = []
+    channels = set()
+    parts = set()
+    for at, message in stream:
+        messages.append((at, mido.Message.from_bytes(message)))
+        status = message[0]
+        if status & 0xF0 == 0xC0 or (status & 0xF0 == 0xB0 and message[1] in (0, 32)):
+            channels.add(status & 0x0F)
+        elif status == 0xF0:
+            bank_type = _bank_type_write(message[1:])
+            if bank_type is not None:
+                parts.add(bank_type[0])
+    return messages, (channels, parts)
+
+def play_units(streams, outports):
+    """Plays each unit's ScheduledStream on its own thread against a shared start time.
+
+    A SysEx burst to one unit then only delays that unit's own messages.
+    Every message is decoded before the clock starts, so the send loop only
+    waits and sends. Returns one (channels, parts) pair per unit, see
+    _prepare_unit().
+    """
+    prepared = [_prepare_unit(stream) for stream in streams]
+    start = time.monotonic()
+    
+    def play_unit(messages, outport):
+        monotonic = time.monotonic
+        send = outport.send
+        for at, msg in messages:
+            delay = start + at - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            send(msg)
+    
+    threads = [threading.Thread(target=play_unit, args=(messages, outport))
+               for (messages, _), outport in zip(prepared, outports)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [changes for _, changes in prepared]
+
+# --- Playback Cache ---
+SCHEDULE_CACHE_FORMAT = 1  # Bump whenever conversion or scheduling output changes
+CACHE_MAGIC = b'GSNC'
+CACHE_SUFFIX = '.cache'
+DEFAULT_CACHE_MB = 512
+
+def mapping_version():
+    """Returns a digest of the mapping tables and output format, for cache keys."""
+    digest = hashlib.sha1()
+    for table in (SUPERNATURAL_MAP, SUPERNATURAL_TONE_MAP, TONE_CATEGORY, BANK_MSB, BANK_LSB,
+                  SN_DRUM_KITS, GM2_DRUM_MAP, TONE_BANK_TYPES):
+        digest.update(repr(table).encode('utf-8'))
+    digest.update(repr((SCHEDULE_CACHE_FORMAT, SETTLE_TICKS, GM2_MSB, GM2_DRUM_MSB, GM2_LSB)).encode('utf-8'))
+    return digest.hexdigest()
+
+def default_cache_dir():
+    """Returns the playback cache directory under $XDG_CACHE_HOME or ~/.cache."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gm1tosn')
+
+class PlaybackCache:
+    """On-disk LRU cache of converted songs, ready to send.
+
+    An entry holds the part set-up a song needs (sent as a Studio Set diff
+    before it plays, see send_studio_set_updates()) and one ScheduledStream
+    per unit. Entries are keyed by the input file's content,
+    mapping_version() and the target device IDs. Reading an entry touches
+    it, and once the cache grows past ``max_bytes`` the least recently
+    used entries are removed.
+
+    The cache never stops a song from playing: if the directory cannot be
+    used the cache turns itself off (``enabled``), unreadable entries are
+    misses and failed writes are only reported.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_MB << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = mapping_version()
+        self.enabled = True
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            print(f"Playback cache disabled: {e}")
+            self.enabled = False
+
+    def key(self, input_file, device_ids):
+        """Returns the cache key for playing ``input_file`` on ``device_ids``."""
+        ids = ','.join(f"{device_id:02X}" for device_id in device_ids)
+        text = f"{file_digest(input_file)}:{self.version}:{ids}"
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """Returns (part_setup, streams) for a key, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except OSError:
+            return None
+        try:
+            entry = self._decode(blob)
+        except (ValueError, KeyError, TypeError):
+            return None  # Not an entry this version wrote
+        if entry is not None:
+            with contextlib.suppress(OSError):
+                os.utime(path)
+        return entry
+
+    @staticmethod
+    def _decode(blob):
+        if blob[:4] != CACHE_MAGIC:
+            return None
+        header_end = 8 + int.from_bytes(blob[4:8], 'big')
+        header = json.loads(blob[8:header_end])
+        if header.get('format') != SCHEDULE_CACHE_FORMAT or header.get('byteorder') != sys.byteorder:
+            return None
+        expected = header_end + sum(8 * count + 4 * (count + 1) + size for count, size in header['streams'])
+        if len(blob) != expected:
+            return None  # Truncated entry
+        part_setup = {int(unit): {int(part): tuple(target) for part, target in parts.items()}
+                      for unit, parts in header['part_setup'].items()}
+        streams = []
+        offset = header_end
+        view = memoryview(blob)
+        for count, size in header['streams']:
+            times = array('d')
+            times.frombytes(view[offset:offset + 8 * count])
+            offset += 8 * count
+            offsets = array('I')
+            offsets.frombytes(view[offset:offset + 4 * (count + 1)])
+            offset += 4 * (count + 1)
+            streams.append(ScheduledStream(times, offsets, bytearray(view[offset:offset + size])))
+            offset += size
+        return part_setup, streams
+
+    def put(self, key, part_setup, streams):
+        """Stores an entry atomically, then evicts down to ``max_bytes``.
+
+        An entry larger than the whole cache is not stored. The entry is
+        written to a temporary file of its own first, so concurrent writers
+        never see each other's partial files.
+        """
+        if not self.enabled:
+            return
+        header = json.dumps({
+            'format': SCHEDULE_CACHE_FORMAT,
+            'byteorder': sys.byteorder,
+            'part_setup': {unit: {part: list(target) for part, target in parts.items()}
+                           for unit, parts in part_setup.items()},
+            'streams': [[len(stream), len(stream.data)] for stream in streams],
+        }).encode('utf-8')
+        size = 8 + len(header) + sum(8 * len(stream) + 4 * (len(stream) + 1) + len(stream.data)
+                                     for stream in streams)
+        if size > self.max_bytes:
+            return
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(CACHE_MAGIC + len(header).to_bytes(4, 'big') + header)
+                for stream in streams:
+                    f.write(stream.times.tobytes())
+                    f.write(stream.offsets.tobytes())
+                    f.write(stream.data)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            print(f"Could not write playback cache entry: {e}")
+            if temp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in ``max_bytes``."""
+        entries = []
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if entry.name.endswith(CACHE_SUFFIX):
+                        with contextlib.suppress(OSError):  # Removed by another process
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            print(f"Could not scan playback cache: {e}")
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+
+def load_song(input_file, device_ids, cache=None):
+    """Returns (part_setup, streams, cached) for playing a file on ``device_ids``.
+
+    A cache hit skips parsing and conversion entirely; a miss converts the
+    file and stores the result.
+    """
+    if cache is not None and not cache.enabled:
+        cache = None
+    key = None
+    if cache is not None:
+        key = cache.key(input_file, device_ids)
+        entry = cache.get(key)
+        if entry is not None:
+            return (*entry, True)
+    part_setup = {}
+    output_mid = convert_midi(read_packed_midi(input_file), part_setup=part_setup, device_ids=device_ids)
+    streams = [schedule_unit(unit_file) for unit_file in split_units(output_mid, len(device_ids))]
+    if cache is not None:
+        cache.put(key, part_setup, streams)
+    return part_setup, streams, False
+
+def setlist_files(paths):
+    """Expands setlist arguments: directories give their MIDI files in name order."""
+    input_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            input_files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(('.mid', '.midi'))))
+        else:
+            input_files.extend(expand_input_files([path]))
+    return input_files
+
+def add_cache_arguments(parser):
+    """Adds the playback cache options shared by ``play`` and ``prewarm``."""
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help='Playback cache directory (default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_MB,
+                        help='Playback cache size limit in MB (default: %(default)s)')
+
+def parse_device_ids(text):
+    """Parses a comma-separated list of device IDs such as "0x10,0x11"."""
+    return tuple(int(value, 0) for value in text.split(','))
+
+def play_main(argv):
+    """Entry point for the ``play`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='gm1tosn.py play',
+        description='Convert and play GM1 MIDI files on an Integra-7, sending only changed part settings')
+    parser.add_argument('input_files', nargs='+',
+                        help='Input MIDI file(s), pattern(s) or setlist directories, played in order')
+    parser.add_argument('--port', action='append', required=True,
+                        help='MIDI output port connected to an Integra-7; repeat once per unit')
+    parser.add_argument('--input-port', action='append',
+                        help='MIDI input port from each Integra-7, in --port order; '
+                             'without it the first song sets every part blind')
+    parser.add_argument('--device-ids', type=parse_device_ids,
+                        help='Comma-separated device IDs in --port order (default: 0x10, 0x11, ...)')
+    parser.add_argument('--timeout', type=float, default=0.2,
+                        help='Seconds to wait for each data request reply (default: 0.2)')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='Data request retries per part (default: 2)')
+    add_cache_arguments(parser)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Convert every file instead of using the playback cache')
+    args = parser.parse_args(argv)
+    
+    units = len(args.port)
+    device_ids = args.device_ids or unit_device_ids(units)
+    if len(device_ids) != units:
+        parser.error("--device-ids needs one ID per --port")
+    if args.input_port and len(args.input_port) != units:
+        parser.error("--input-port needs one port per --port")
+    
+    input_files = setlist_files(args.input_files)
+    cache = None if args.no_cache else PlaybackCache(args.cache_dir, args.cache_size << 20)
+    # Cached parameters of each unit, kept across the setlist
+    device_states = [{} for _ in range(units)]
+    # Units that answer data requests; the others run on tracked state and blind updates
+    readable = [bool(args.input_port)] * units
+    outports = []
+    inports = []
+    try:
+        outports = [mido.open_output(name) for name in args.port]
+        inports = [mido.open_input(name) for name in args.input_port or ()]
+        for input_file in input_files:
+            print(f"\nLoading {input_file}")
+            try:
+                part_setup, streams, cached = load_song(input_file, device_ids, cache)
+            except (OSError, ValueError, EOFError) as e:
+                print(f"Error loading MIDI file: {e or type(e).__name__}")
+                continue
+            if cached:
+                print("Using cached conversion")
+            for unit, device_id in enumerate(device_ids):
+                targets = studio_set_targets(part_setup.get(unit, {}))
+                if readable[unit]:
+                    try:
+                        read_studio_set(inports[unit], outports[unit], targets, device_states[unit],
+                                        args.timeout, args.retries, device_id)
+                    except TimeoutError as e:
+                        # Don't wait on every song change for a unit that doesn't answer
+                        print(f"{e}; not reading unit {unit} back for the rest of the setlist")
+                        readable[unit] = False
+                sent = send_studio_set_updates(outports[unit], device_states[unit], targets,
+                                               device_id=device_id)
+                print(f"Sent {sent} Studio Set update(s) for {len(targets)} part(s) to unit {unit}")
+            print(f"Playing {input_file}")
+            changes = play_units(streams, outports)
+            for device_state, (channels, parts) in zip(device_states, changes):
+                forget_changed_parts(device_state, channels, parts)
+    finally:
+        for port in outports + inports:
+            port.close()
+    return 0
+
+def prewarm_main(argv):
+    """Entry point for the ``prewarm`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='gm1tosn.py prewarm',
+        description='Convert a setlist into the playback cache ahead of time')
+    parser.add_argument('input_files', nargs='+',
+                        help='Input MIDI file(s), pattern(s) or setlist directories')
+    parser.add_argument('--units', type=int, default=1,
+                        help='Number of Integra-7 units it will be played on (default: 1)')
+    parser.add_argument('--device-ids', type=parse_device_ids,
+                        help='Comma-separated device IDs, as given to play (default: 0x10, 0x11, ...)')
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    device_ids = args.device_ids or unit_device_ids(args.units)
+    cache = PlaybackCache(args.cache_dir, args.cache_size << 20)
+    failed = 0
+    for input_file in setlist_files(args.input_files):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, streams, cached = load_song(input_file, device_ids, cache)
+        except (OSError, ValueError, EOFError) as e:
+            print(f"{input_file}: error: {e or type(e).__name__}")
+            failed += 1
+            continue
+        status = "already cached" if cached else "cached"
+        print(f"{input_file}: {status} ({sum(len(stream) for stream in streams)} messages)")
+    return 1 if failed else 0
+
+# --- Live MIDI Thru ---
+THRU_LATENCY_SAMPLES = 1 << 16
+
+def build_thru_table(device_id=DEVICE_ID):
+    """Precomputes what the thru filter sends for every channel and GM1 program.
+
+    Returns table[channel][program] = (key, messages): ``key`` identifies the
+    selected tone for de-duplication (program number only on the drum
+    channel, like select_program()), and ``messages`` is a tuple of raw
+    MIDI byte strings: the tone bank type DT1, bank select MSB/LSB and the
+    mapped program change.
+    """
+    table = []
+    for channel in range(16):
+        row = []
+        for program in range(128):
+            msb, lsb, program_num, _ = map_program(channel, program)
+            part_address = STUDIO_SET_PART_BASE + (channel * PART_OFFSET) + TONE_BANK_TYPE
+            messages = (
+                bytes(create_sysex(part_address, [TONE_BANK_TYPES.get(msb, 0)], device_id=device_id).bytes()),
+                bytes([0xB0 | channel, 0, msb]),
+                bytes([0xB0 | channel, 32, lsb]),
+                bytes([0xC0 | channel, program_num]),
+            )
+            key = program_num if channel == DRUM_CHANNEL else (msb, lsb, program_num)
+            row.append((key, messages))
+        table.append(tuple(row))
+    return tuple(table)
+
+class ThruFilter:
+    """Rewrites a live GM1 stream for the Integra-7, one message at a time.
+
+    Bank selects are swallowed, program changes are replaced with their
+    precomputed SuperNATURAL/GM2 selection (only when the part's tone
+    actually changes), and everything else is passed on untouched. The
+    per-message path only indexes precomputed tables, and the time spent
+    in it is kept in a fixed-size ring of nanosecond samples.
+    """
+    __slots__ = ('send', 'table', 'current', 'latencies', 'count')
+
+    def __init__(self, send, device_id=DEVICE_ID, samples=THRU_LATENCY_SAMPLES):
+        self.send = send
+        self.table = build_thru_table(device_id)
+        self.current = [None] * 16
+        self.latencies = array('q', bytes(8 * samples))
+        self.count = 0
+
+    def process(self, message):
+        """Handles one raw incoming message (a sequence of byte values)."""
+        start = perf_counter_ns()
+        status = message[0]
+        kind = status & 0xF0
+        if kind == 0xC0:
+            channel = status & 0x0F
+            key, messages = self.table[channel][message[1]]
+            if self.current[channel] != key:
+                self.current[channel] = key
+                send = self.send
+                for out in messages:
+                    send(out)
+        elif kind != 0xB0 or (message[1] != 0 and message[1] != 32):
+            self.send(message)
+        latencies = self.latencies
+        latencies[self.count % len(latencies)] = perf_counter_ns() - start
+        self.count += 1
+
+    def on_event(self, event, data=None):
+        """python-rtmidi input callback: ``event`` is (message, delta_seconds)."""
+        self.process(event[0])
+
+    def latency_percentiles(self, percentiles=(50, 90, 99, 99.9)):
+        """Returns {percentile: microseconds} (plus 'max') over the recorded samples."""
+        samples = sorted(self.latencies[:min(self.count, len(self.latencies))])
+        if not samples:
+            return {}
+        result = {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] / 1000
+                  for p in percentiles}
+        result['max'] = samples[-1] / 1000
+        return result
+
+def _open_rtmidi_port(port, name, virtual):
+    """Opens an rtmidi port by exact or partial name, or as a new virtual port."""
+    if virtual:
+        port.open_virtual_port(name)
+        return
+    names = port.get_ports()
+    for index, port_name in enumerate(names):
+        if port_name == name or name in port_name:
+            port.open_port(index)
+            return
+    raise ValueError(f"MIDI port {name!r} not found; available: {', '.join(names) or 'none'}")
+
+def thru_main(argv):
+    """Entry point for the ``thru`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='gm1tosn.py thru',
+        description='Live GM1 to SuperNATURAL filter between a MIDI input and output port')
+    parser.add_argument('--input', required=True, help='MIDI input port (keyboard or sequencer)')
+    parser.add_argument('--output', required=True, help='MIDI output port connected to the Integra-7')
+    parser.add_argument('--virtual', action='store_true',
+                        help='Create virtual ports with these names instead of opening existing ones')
+    parser.add_argument('--device-id', type=lambda value: int(value, 0), default=DEVICE_ID,
+                        help='Integra-7 device ID (default: 0x10)')
+    args = parser.parse_args(argv)
     
-    if not input_files:
+    import rtmidi
+    
+    midi_in = rtmidi.MidiIn()
+    midi_out = rtmidi.MidiOut()
+    try:
+        _open_rtmidi_port(midi_out, args.output, args.virtual)
+        _open_rtmidi_port(midi_in, args.input, args.virtual)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    midi_in.ignore_types(sysex=False, timing=False, active_sense=False)
+    thru = ThruFilter(midi_out.send_message, args.device_id)
+    midi_in.set_callback(thru.on_event)
+    print(f"Filtering {args.input} -> {args.output} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        midi_in.cancel_callback()
+        midi_in.close_port()
+        midi_out.close_port()
+    
+    print(f"\nProcessed {thru.count} message(s)")
+    for percentile, micros in thru.latency_percentiles().items():
+        label = percentile if percentile == 'max' else f"p{percentile}"
+        print(f"  {label}: {micros:.1f} us")
+    return 0
+
+def convert_main(argv):
+    """Entry point for the default convert command."""
+    parser = argparse.ArgumentParser(
+        description='Convert GM1 MIDI file to use Integra-7 Supernatural sounds')
+    parser.add_argument('input_files', nargs='+', help='Input MIDI file(s) or pattern(s)')
+    parser.add_argument('--units', type=int, default=1,
+                        help='Number of Integra-7 units to spread midi_port parts over (default: 1)')
+    parser.add_argument('--device-ids', type=parse_device_ids,
+                        help='Comma-separated device IDs, one per unit (default: 0x10, 0x11, ...)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Convert the tracks of each file on this many processes (default: 1)')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='Only convert the i-th of N stable slices of the inputs (1-based)')
+    parser.add_argument('--shard-key', choices=('path', 'content'), default='path',
+                        help='Hash file paths or file contents to pick shards (default: path)')
+    parser.add_argument('--manifest',
+                        help='Shard result manifest (default: gm1tosn-shard-i-of-N.json)')
+    
+    args = parser.parse_args(argv)
+    device_ids = args.device_ids or unit_device_ids(args.units)
+    
+    # Process each argument which could be a pattern or a file
+    input_files = expand_input_files(args.input_files)
+    manifest = None
+    if args.shard:
+        index, shards = args.shard
+        total = len(input_files)
+        input_files = select_shard(input_files, index, shards, args.shard_key)
+        print(f"Shard {index}/{shards}: {len(input_files)} of {total} file(s)")
+        manifest_path = args.manifest or f"gm1tosn-shard-{index}-of-{shards}.json"
+        manifest = {'shard': index, 'shards': shards, 'shard_key': args.shard_key,
+                    'status': 'running', 'files': []}
+    
+    if not input_files and manifest is None:
         print("No input files specified")
-        exit(1)
+        return 1
     
     print(f"\nFound {len(input_files)} file(s) to process")
     
     # Process each file
-    for input_file in input_files:
-        # Generate output filename by prepending "SN" to the input filename
-        input_dir = os.path.dirname(input_file)
-        input_basename = os.path.basename(input_file)
-        output_basename = "SN" + input_basename
-        output_file = os.path.join(input_dir, output_basename)
-        
-        print(f"\nProcessing file {input_files.index(input_file) + 1}/{len(input_files)}...")
-        print(f"Input file: {input_file}")
-        print(f"Output file: {output_file}")
-        map_gm1_to_supernatural(input_file, output_file)
+    failed = 0
+    started = time.perf_counter()
+    try:
+        for index, input_file in enumerate(input_files):
+            output_file = output_path_for(input_file)
+            
+            print(f"\nProcessing file {index + 1}/{len(input_files)}...")
+            print(f"Input file: {input_file}")
+            print(f"Output file: {output_file}")
+            file_started = time.perf_counter()
+            mapping, error = map_gm1_to_supernatural(input_file, output_file, device_ids, args.jobs)
+            if error:
+                failed += 1
+            if manifest is not None:
+                entry = {'input': input_file, 'output': output_file,
+                         'status': 'error' if error else 'ok',
+                         'seconds': round(time.perf_counter() - file_started, 4)}
+                if error:
+                    entry['error'] = error
+                else:
+                    entry['mapping'] = mapping_summary(mapping)
+                manifest['files'].append(entry)
+        if manifest is not None:
+            manifest['status'] = 'failed' if failed else 'ok'
+    finally:
+        if manifest is not None:
+            if manifest['status'] == 'running':
+                manifest['status'] = 'incomplete'
+            manifest['seconds'] = round(time.perf_counter() - started, 3)
+            write_manifest(manifest_path, manifest)
+            print(f"\nShard manifest written to {manifest_path}")
+    return 1 if failed and manifest is not None else 0
+
+COMMANDS = {
+    'verify': verify_main,
+    'play': play_main,
+    'merge-reports': merge_reports_main,
+    'thru': thru_main,
+    'plan': plan_main,
+    'prewarm': prewarm_main,
+}
+
+def main(argv=None):
+    """Dispatches to a subcommand, defaulting to conversion."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    return convert_main(argv)
+
+if __name__ == "__main__":
+    sys.exit(main())
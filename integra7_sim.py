@@ -0,0 +1,283 @@
+"""Offline Integra-7 model for checking converted output without hardware.
+
+The simulator decodes the Roland DT1/RQ1 SysEx that gm1tosn.py sends, keeps
+the Studio Set part parameters, applies bank and program changes per part
+and models MIDI wire bandwidth and tone-load latency. It can be driven
+directly from Python, fed a whole MidiFile on a virtual clock, or served
+behind a virtual MIDI port so the live tools can talk to it.
+"""
+import argparse
+import sys
+import time
+from collections import deque
+
+import mido
+
+from gm1tosn import (
+    COMMAND_DT1,
+    COMMAND_RQ1,
+    DEVICE_ID,
+    MANUFACTURER_ID,
+    MODEL_ID,
+    PART_BLOCK_SIZE,
+    PART_SWITCH,
+    RECEIVE_CHANNEL,
+    TONE_BANK_LSB,
+    TONE_BANK_MSB,
+    TONE_BANK_TYPE,
+    TONE_PC,
+    convert_midi,
+    create_sysex,
+    expand_input_files,
+    parse_sysex,
+    part_base_address,
+)
+
+# --- Wire Model ---
+MIDI_BAUD = 31250
+BITS_PER_BYTE = 10  # Start bit + 8 data bits + stop bit
+WIRE_SECONDS_PER_BYTE = BITS_PER_BYTE / MIDI_BAUD
+
+# Modelled time to load a tone after a program change, by Tone Bank Type
+TONE_LOAD_SECONDS = {
+    0: 0.010,  # PCM Synth
+    1: 0.060,  # SN-A
+    2: 0.030,  # SN-S
+    3: 0.080,  # SN-D
+}
+BANK_TYPE_NAMES = {0: "PCM", 1: "SN-A", 2: "SN-S", 3: "SN-D"}
+BROADCAST_DEVICE_ID = 0x7F
+
+
+class Integra7Simulator:
+    """Virtual Integra-7 that tracks Studio Set parts and message timing.
+
+    ``send()`` takes mido messages like an output port; replies to RQ1
+    requests come back through ``poll()``/``iter_pending()`` like an input
+    port, so the same object can stand in for both ports of a real unit.
+    Times are in seconds on a virtual clock unless ``clock`` is given.
+    """
+
+    def __init__(self, device_id=DEVICE_ID, tone_load_seconds=None,
+                 wire_seconds_per_byte=WIRE_SECONDS_PER_BYTE, clock=None):
+        self.device_id = device_id
+        self.tone_load_seconds = dict(TONE_LOAD_SECONDS if tone_load_seconds is None
+                                      else tone_load_seconds)
+        self.wire_seconds_per_byte = wire_seconds_per_byte
+        self.clock = clock
+        self.replies = deque()
+        self.reset()
+
+    def reset(self):
+        """Restores power-on part settings and clears all statistics."""
+        self.memory = {}
+        for part in range(16):
+            base = part_base_address(part)
+            for offset in range(PART_BLOCK_SIZE):
+                self.memory[base + offset] = 0
+            self.memory[base + PART_SWITCH] = 1
+            self.memory[base + RECEIVE_CHANNEL] = part
+        self.replies.clear()
+        self.now = 0.0
+        self._wire_free_at = 0.0
+        self._part_ready_at = [0.0] * 16
+        self._first_note_at = None
+        self._setup_ready_at = 0.0
+        self.messages = 0
+        self.bytes = 0
+        self.dropped = {}
+        self.overlapped_notes = 0
+        self.overlapped_loads = 0
+        self.tone_loads = 0
+        self.wire_delayed = 0
+        self.max_wire_delay = 0.0
+
+    # --- Port interface ---
+    def send(self, msg, at=None):
+        """Delivers a message scheduled for time ``at`` over the modelled wire.
+
+        Returns the time the last byte arrives at the unit.
+        """
+        if at is None:
+            at = self.clock() if self.clock is not None else self.now
+        size = len(msg.bin())
+        start = max(at, self._wire_free_at)
+        arrival = start + size * self.wire_seconds_per_byte
+        self._wire_free_at = arrival
+        self.now = max(self.now, arrival)
+        if start > at:
+            self.wire_delayed += 1
+            self.max_wire_delay = max(self.max_wire_delay, start - at)
+        self.messages += 1
+        self.bytes += size
+        if msg.type == 'sysex':
+            self._handle_sysex(msg, arrival)
+        elif hasattr(msg, 'channel'):
+            self._handle_channel(msg, arrival)
+        return arrival
+
+    def poll(self):
+        """Returns the next reply message, or None."""
+        return self.replies.popleft() if self.replies else None
+
+    def iter_pending(self):
+        """Yields all reply messages waiting to be read."""
+        while self.replies:
+            yield self.replies.popleft()
+
+    # --- Message handling ---
+    def _drop(self, reason):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+
+    def _parts_on_channel(self, channel):
+        for part in range(16):
+            base = part_base_address(part)
+            if self.memory[base + PART_SWITCH] and self.memory[base + RECEIVE_CHANNEL] == channel:
+                yield part
+
+    def _handle_sysex(self, msg, arrival):
+        data = msg.data
+        if len(data) < 3 or data[0] != MANUFACTURER_ID or data[2] != MODEL_ID:
+            self._drop("foreign sysex")
+            return
+        parsed = parse_sysex(data)
+        if parsed is None:
+            self._drop("bad checksum")
+            return
+        device_id, command, address, values = parsed
+        if device_id not in (self.device_id, BROADCAST_DEVICE_ID):
+            self._drop("other device id")
+            return
+        if command == COMMAND_DT1:
+            for i, value in enumerate(values):
+                self.memory[address + i] = value
+                part, offset = self._part_offset(address + i)
+                if part is not None and offset == TONE_PC:
+                    self._load_tone(part, arrival)
+        elif command == COMMAND_RQ1 and len(values) == 3:
+            size = (values[0] << 14) | (values[1] << 7) | values[2]
+            self.replies.append(create_sysex(address,
+                                             [self.memory.get(address + i, 0) for i in range(size)],
+                                             device_id=self.device_id))
+        else:
+            self._drop("unknown command")
+
+    def _handle_channel(self, msg, arrival):
+        for part in self._parts_on_channel(msg.channel):
+            base = part_base_address(part)
+            if msg.type == 'control_change' and msg.control == 0:
+                self.memory[base + TONE_BANK_MSB] = msg.value
+            elif msg.type == 'control_change' and msg.control == 32:
+                self.memory[base + TONE_BANK_LSB] = msg.value
+            elif msg.type == 'program_change':
+                self.memory[base + TONE_PC] = msg.program
+                self._load_tone(part, arrival)
+            elif msg.type == 'note_on' and msg.velocity > 0:
+                if self._first_note_at is None:
+                    self._first_note_at = arrival
+                if arrival < self._part_ready_at[part]:
+                    self.overlapped_notes += 1
+
+    def _part_offset(self, address):
+        """Splits an address into (part, offset), or (None, None) outside the parts."""
+        for part in range(16):
+            offset = address - part_base_address(part)
+            if 0 <= offset < PART_BLOCK_SIZE:
+                return part, offset
+        return None, None
+
+    def _load_tone(self, part, arrival):
+        if arrival < self._part_ready_at[part]:
+            self.overlapped_loads += 1
+        bank_type = self.memory[part_base_address(part) + TONE_BANK_TYPE]
+        self._part_ready_at[part] = arrival + self.tone_load_seconds.get(bank_type, 0.0)
+        self.tone_loads += 1
+        if self._first_note_at is None:
+            self._setup_ready_at = max(self._setup_ready_at, self._part_ready_at[part])
+
+    # --- Results ---
+    def part_tones(self):
+        """Returns {part: (bank type name, msb, lsb, program)} for switched-on parts."""
+        tones = {}
+        for part in range(16):
+            base = part_base_address(part)
+            if self.memory[base + PART_SWITCH]:
+                tones[part] = (BANK_TYPE_NAMES.get(self.memory[base + TONE_BANK_TYPE], "?"),
+                               self.memory[base + TONE_BANK_MSB],
+                               self.memory[base + TONE_BANK_LSB],
+                               self.memory[base + TONE_PC])
+        return tones
+
+    def report(self):
+        """Summarizes tones, timing and message problems since the last reset."""
+        return {
+            'parts': self.part_tones(),
+            'time_to_ready': self._setup_ready_at,
+            'first_note_at': self._first_note_at,
+            'messages': self.messages,
+            'bytes': self.bytes,
+            'dropped': dict(self.dropped),
+            'tone_loads': self.tone_loads,
+            'overlapped_loads': self.overlapped_loads,
+            'overlapped_notes': self.overlapped_notes,
+            'wire_delayed': self.wire_delayed,
+            'max_wire_delay': self.max_wire_delay,
+        }
+
+    def play_file(self, mid):
+        """Feeds a MidiFile through the simulator on the virtual clock and returns report()."""
+        at = 0.0
+        for msg in mid:
+            at += msg.time
+            if not msg.is_meta:
+                self.send(msg, at=at)
+        return self.report()
+
+
+def serve_virtual_port(simulator, name="Integra-7 Simulator"):
+    """Runs the simulator behind a virtual MIDI port until interrupted.
+
+    Needs a backend with virtual port support (python-rtmidi).
+    """
+    simulator.clock = time.monotonic
+    with mido.open_ioport(name, virtual=True) as port:
+        print(f"Serving simulated Integra-7 on virtual port '{name}'")
+        for msg in port:
+            simulator.send(msg)
+            for reply in simulator.iter_pending():
+                port.send(reply)
+
+
+def print_report(report):
+    """Prints a simulator report."""
+    print("Part tones:")
+    for part, (bank_type, msb, lsb, program) in sorted(report['parts'].items()):
+        print(f"  Part {part:2d}: {bank_type:4s} MSB={msb} LSB={lsb} Program={program}")
+    print(f"Time to ready: {report['time_to_ready'] * 1000:.1f} ms")
+    print(f"Messages: {report['messages']} ({report['bytes']} bytes)")
+    print(f"Tone loads: {report['tone_loads']} ({report['overlapped_loads']} overlapped)")
+    print(f"Notes during tone load: {report['overlapped_notes']}")
+    print(f"Wire-delayed messages: {report['wire_delayed']} "
+          f"(max {report['max_wire_delay'] * 1000:.1f} ms)")
+    if report['dropped']:
+        print("Dropped: " + ", ".join(f"{reason}={count}" for reason, count in report['dropped'].items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Run converted MIDI files through a simulated Integra-7')
+    parser.add_argument('input_files', nargs='*', help='GM1 MIDI file(s) or pattern(s) to convert and simulate')
+    parser.add_argument('--serve', metavar='PORT_NAME',
+                        help='Serve the simulator on a virtual MIDI port instead')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_virtual_port(Integra7Simulator(), args.serve)
+        sys.exit(0)
+    if not args.input_files:
+        parser.error("no input files given")
+
+    for input_file in expand_input_files(args.input_files):
+        print(f"\nSimulating {input_file}")
+        simulator = Integra7Simulator()
+        print_report(simulator.play_file(convert_midi(mido.MidiFile(input_file))))
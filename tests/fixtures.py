@@ -0,0 +1,63 @@
+"""Small GM1 songs and helpers shared by the tests."""
+import contextlib
+import io
+import os
+
+import mido
+
+from gm1tosn import DRUM_CHANNEL
+
+# (channel, GM1 programs in order) for each part track; the second program is a mid-track change
+PARTS = ((0, (0, 40)), (1, (24, 56)), (2, (33, 34)))
+DRUM_KITS = (0, 16, 25, 0)
+
+
+def part_track(channel, programs, port=None):
+    """A track that selects each program in turn and plays four notes after each."""
+    track = mido.MidiTrack()
+    if port is not None:
+        track.append(mido.MetaMessage('midi_port', port=port))
+    track.append(mido.MetaMessage('track_name', name=f"Part {channel + 1}"))
+    note = 36 if channel == DRUM_CHANNEL else 60 + channel
+    for i, program in enumerate(programs):
+        track.append(mido.Message('control_change', channel=channel, control=0, value=0,
+                                  time=0 if i == 0 else 240))
+        track.append(mido.Message('program_change', channel=channel, program=program))
+        for n in range(4):
+            track.append(mido.Message('note_on', channel=channel, note=note + n, velocity=90))
+            if n == 1:
+                track.append(mido.Message('control_change', channel=channel, control=7, value=100, time=60))
+                track.append(mido.Message('pitchwheel', channel=channel, pitch=512))
+            track.append(mido.Message('note_off', channel=channel, note=note + n, time=240))
+    return track
+
+
+def gm1_song(ports=1):
+    """A conductor track plus three part tracks and a drum track per source port."""
+    mid = mido.MidiFile(ticks_per_beat=480)
+    mid.tracks.append(mido.MidiTrack([
+        mido.MetaMessage('set_tempo', tempo=500000),
+        mido.MetaMessage('time_signature', numerator=4, denominator=4),
+        mido.MetaMessage('marker', text='B', time=960),
+        mido.MetaMessage('set_tempo', tempo=400000, time=960),
+    ]))
+    for port in range(ports):
+        midi_port = port if ports > 1 else None
+        for channel, programs in PARTS:
+            mid.tracks.append(part_track(channel, programs, midi_port))
+        mid.tracks.append(part_track(DRUM_CHANNEL, DRUM_KITS, midi_port))
+    return mid
+
+
+def save_song(directory, name='song.mid', ports=1):
+    """Saves gm1_song() in ``directory`` and returns its path."""
+    path = os.path.join(directory, name)
+    gm1_song(ports).save(path)
+    return path
+
+
+def quietly(function, *args, **kwargs):
+    """Calls ``function`` with its printed output captured; returns (result, output)."""
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        result = function(*args, **kwargs)
+    return result, out.getvalue()
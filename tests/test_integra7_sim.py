@@ -0,0 +1,229 @@
+"""Tests for the live-device helpers, run against the simulated Integra-7."""
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import mido
+
+import gm1tosn
+from gm1tosn import (
+    COMMAND_DT1,
+    COMMAND_RQ1,
+    PART_BLOCK_SIZE,
+    PART_OFFSET,
+    PART_SWITCH,
+    RECEIVE_CHANNEL,
+    STUDIO_SET_PART_BASE,
+    TONE_BANK_LSB,
+    TONE_BANK_MSB,
+    TONE_BANK_TYPE,
+    TONE_PC,
+    create_data_request,
+    create_sysex,
+    parse_sysex,
+    part_base_address,
+    read_part_block,
+    studio_set_targets,
+    studio_set_updates,
+)
+from integra7_sim import WIRE_SECONDS_PER_BYTE, Integra7Simulator
+from tests.fixtures import quietly, save_song
+
+
+class CorruptingPort:
+    """Simulator front end that flips a checksum bit in the first ``corrupt`` replies."""
+
+    def __init__(self, simulator, corrupt=0):
+        self.simulator = simulator
+        self.corrupt = corrupt
+        self.requests = 0
+
+    def send(self, msg):
+        self.requests += 1
+        self.simulator.send(msg)
+
+    def poll(self):
+        msg = self.simulator.poll()
+        if msg is not None and self.corrupt:
+            self.corrupt -= 1
+            data = list(msg.data)
+            data[-1] ^= 1
+            msg = mido.Message('sysex', data=data)
+        return msg
+
+
+class SplittingPort(CorruptingPort):
+    """Simulator front end that answers every request with two DT1 messages."""
+
+    def poll(self):
+        msg = self.simulator.poll()
+        if msg is None:
+            return None
+        device_id, _, address, values = parse_sysex(msg.data)
+        self.simulator.replies.appendleft(create_sysex(address + 4, values[4:], device_id=device_id))
+        return create_sysex(address, values[:4], device_id=device_id)
+
+
+class SilentPort:
+    """A unit that never answers."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def send(self, msg):
+        self.requests += 1
+
+    def poll(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class ReadPartBlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = Integra7Simulator()
+        self.simulator.memory[part_base_address(3) + TONE_PC] = 42
+
+    def test_reads_part_block(self):
+        port = CorruptingPort(self.simulator)
+        values = read_part_block(port, port, 3, timeout=0.05, retries=0)
+        self.assertEqual(len(values), PART_BLOCK_SIZE)
+        self.assertEqual(values[RECEIVE_CHANNEL], 3)
+        self.assertEqual(values[TONE_PC], 42)
+
+    def test_reassembles_split_reply(self):
+        port = SplittingPort(self.simulator)
+        values = read_part_block(port, port, 3, timeout=0.05, retries=0)
+        self.assertEqual(values[TONE_PC], 42)
+        self.assertEqual(values[PART_SWITCH], 1)
+
+    def test_retries_after_bad_checksum(self):
+        port = CorruptingPort(self.simulator, corrupt=1)
+        values = read_part_block(port, port, 3, timeout=0.05, retries=1)
+        self.assertEqual(values[TONE_PC], 42)
+        self.assertEqual(port.requests, 2)
+
+    def test_bad_checksum_without_retries_times_out(self):
+        port = CorruptingPort(self.simulator, corrupt=1)
+        with self.assertRaises(TimeoutError):
+            read_part_block(port, port, 3, timeout=0.05, retries=0)
+
+    def test_times_out_after_retries(self):
+        port = SilentPort()
+        with self.assertRaises(TimeoutError):
+            read_part_block(port, port, 3, timeout=0.01, retries=2)
+        self.assertEqual(port.requests, 3)
+
+
+class DataRequestTest(unittest.TestCase):
+
+    def test_size_is_sent_in_seven_bit_groups(self):
+        request = create_data_request(part_base_address(0), 200)
+        self.assertEqual(parse_sysex(request.data)[3], [0, 1, 72])
+        request = create_data_request(part_base_address(0), 0x4000)
+        self.assertEqual(parse_sysex(request.data)[3], [1, 0, 0])
+
+    def test_simulator_answers_large_request(self):
+        simulator = Integra7Simulator()
+        simulator.send(create_data_request(part_base_address(0), 200))
+        reply = simulator.poll()
+        _, command, address, values = parse_sysex(reply.data)
+        self.assertEqual((command, address, len(values)), (COMMAND_DT1, part_base_address(0), 200))
+        self.assertEqual(values[PART_SWITCH], 1)
+        self.assertEqual(values[PART_BLOCK_SIZE:], [0] * (200 - PART_BLOCK_SIZE))
+
+
+class StudioSetUpdatesTest(unittest.TestCase):
+
+    def test_coalesces_adjacent_parameters(self):
+        targets = {5: {PART_SWITCH: 1, RECEIVE_CHANNEL: 5, TONE_BANK_TYPE: 1}}
+        messages = studio_set_updates({}, targets)
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(parse_sysex(messages[0].data),
+                         (0x10, COMMAND_DT1, part_base_address(5) + PART_SWITCH, [1, 5]))
+        self.assertEqual(parse_sysex(messages[1].data),
+                         (0x10, COMMAND_DT1, part_base_address(5) + TONE_BANK_TYPE, [1]))
+
+    def test_sends_only_changes(self):
+        simulator = Integra7Simulator()
+        targets = studio_set_targets({2: (89, 64, 4)})
+        messages = studio_set_updates({}, targets)
+        self.assertEqual([msg.type for msg in messages],
+                         ['sysex', 'control_change', 'control_change', 'program_change'])
+        for msg in messages:
+            simulator.send(msg)
+        self.assertEqual(simulator.part_tones()[2], ('SN-A', 89, 64, 4))
+
+        device_state = {2: {offset: simulator.memory[part_base_address(2) + offset]
+                            for offset in range(PART_BLOCK_SIZE)}}
+        self.assertEqual(studio_set_updates(device_state, targets), [])
+        # Same bank type, new program: just the tone selection
+        messages = studio_set_updates(device_state, studio_set_targets({2: (89, 64, 5)}))
+        self.assertEqual([msg.type for msg in messages],
+                         ['control_change', 'control_change', 'program_change'])
+
+    def test_tone_selection_uses_receive_channel(self):
+        device_state = {2: {RECEIVE_CHANNEL: 7, TONE_BANK_MSB: 0, TONE_BANK_LSB: 0, TONE_PC: 0,
+                            TONE_BANK_TYPE: 1}}
+        messages = studio_set_updates(device_state, studio_set_targets({2: (89, 64, 4)}))
+        self.assertTrue(all(msg.channel == 7 for msg in messages))
+
+
+class PlayReadbackTest(unittest.TestCase):
+
+    def test_stops_reading_back_after_timeout(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        songs = [save_song(directory, f"song{i}.mid") for i in range(3)]
+        output = SilentPort()
+        sent = []
+        output.send = sent.append
+        # Every song changes every part, so each would need reading back again
+        changed = lambda streams, outports: [(set(range(16)), set()) for _ in streams]
+        with mock.patch.object(gm1tosn.mido, 'open_output', return_value=output), \
+                mock.patch.object(gm1tosn.mido, 'open_input', return_value=SilentPort()), \
+                mock.patch.object(gm1tosn, 'play_units', changed):
+            status, out = quietly(gm1tosn.main, ['play', *songs, '--port', 'A', '--input-port', 'A',
+                                                 '--timeout', '0.01', '--retries', '1', '--no-cache'])
+        self.assertEqual(status, 0)
+        requests = [msg for msg in sent if msg.type == 'sysex' and parse_sysex(msg.data)[1] == COMMAND_RQ1]
+        self.assertEqual(len(requests), 2)  # The first part of the first song, with one retry
+        self.assertEqual(out.count("Playing"), 3)
+        self.assertIn("not reading unit 0 back", out)
+
+
+class SimulatorReportTest(unittest.TestCase):
+
+    def test_report_timing(self):
+        # One SN-A set-up at tick 0 and a note 10 ms later, at 120 bpm
+        mid = mido.MidiFile(ticks_per_beat=480)
+        track = mido.MidiTrack()
+        mid.tracks.append(track)
+        bank_type = create_sysex(STUDIO_SET_PART_BASE + 0 * PART_OFFSET + TONE_BANK_TYPE, [1])
+        track.append(bank_type)
+        track.append(mido.Message('control_change', control=0, value=89))
+        track.append(mido.Message('control_change', control=32, value=64))
+        track.append(mido.Message('program_change', program=4))
+        track.append(mido.Message('note_on', note=60, velocity=100, time=10))  # 10.4 ms
+
+        simulator = Integra7Simulator(tone_load_seconds={1: 0.060})
+        report = simulator.play_file(mid)
+
+        setup_bytes = len(bank_type.bin()) + 3 + 3 + 2
+        program_arrival = setup_bytes * WIRE_SECONDS_PER_BYTE
+        self.assertEqual(report['parts'][0], ('SN-A', 89, 64, 4))
+        self.assertAlmostEqual(report['time_to_ready'], program_arrival + 0.060)
+        self.assertAlmostEqual(report['first_note_at'], 10 / 960 + 3 * WIRE_SECONDS_PER_BYTE)
+        self.assertEqual(report['messages'], 5)
+        self.assertEqual(report['bytes'], setup_bytes + 3)
+        self.assertEqual(report['tone_loads'], 1)
+        self.assertEqual(report['overlapped_notes'], 1)
+        self.assertEqual(report['wire_delayed'], 3)
+        self.assertEqual(report['dropped'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
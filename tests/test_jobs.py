@@ -0,0 +1,42 @@
+"""Tests that converting tracks in parallel gives the same file as a serial conversion."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from gm1tosn import DRUM_CHANNEL, map_gm1_to_supernatural, unit_device_ids
+from tests.fixtures import DRUM_KITS, quietly, save_song
+
+
+class ParallelConversionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def convert(self, input_path, units, jobs):
+        output_path = os.path.join(self.directory, f"SN-{units}-{jobs}.mid")
+        (mapping, error), log = quietly(map_gm1_to_supernatural, input_path, output_path,
+                                        unit_device_ids(units), jobs)
+        self.assertIsNone(error)
+        with open(output_path, 'rb') as f:
+            return f.read(), mapping, log.replace(output_path, 'SN.mid')
+
+    def test_jobs_give_identical_output(self):
+        # Two source ports, each with mid-track program changes and drum kit changes
+        input_path = save_song(self.directory, ports=2)
+        for units in (1, 2):
+            with self.subTest(units=units):
+                serial, serial_mapping, serial_log = self.convert(input_path, units, jobs=1)
+                parallel, parallel_mapping, parallel_log = self.convert(input_path, units, jobs=2)
+                self.assertEqual(parallel, serial)
+                self.assertEqual(parallel_mapping, serial_mapping)
+                self.assertEqual(parallel_log, serial_log)
+                # Each unit really switched its bass part and drum kit mid-track
+                for unit in range(units):
+                    self.assertEqual(len(serial_mapping[unit, 2]), 2)
+                    self.assertEqual(len(serial_mapping[unit, DRUM_CHANNEL]), len(set(DRUM_KITS)) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
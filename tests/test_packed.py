@@ -0,0 +1,101 @@
+"""Round-trip tests for the packed event model."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mido
+
+from gm1tosn import PackedTrack, _encode_varlen, read_packed_midi, write_smf
+
+# One track written the way a sequencer might: long meta events, running
+# status, and a SysEx message split into an F0 packet and an F7 continuation
+TRACK = b''.join([
+    b'\x00\xff\x03' + _encode_varlen(200) + b'n' * 200,
+    b'\x00\xff\x7f' + _encode_varlen(128) + bytes(range(128)),
+    b'\x00\x90\x3c\x64',
+    b'\x0a\x3e\x64',
+    b'\x00\xf0\x05\x41\x10\x42\x12\xf7',
+    b'\x00\xb0\x07\x64',
+    b'\x00\xf0\x03\x41\x10\x42',
+    b'\x05\xf7\x02\x12\xf7',
+    b'\x00\xc0\x05',
+    b'\x00\x25',
+    b'\x60\x80\x3c\x00',
+    b'\x00\xff\x2f\x00',
+])
+EVENTS = [
+    (0, 0xFF, b'\x03' + b'n' * 200),
+    (0, 0xFF, b'\x7f' + bytes(range(128))),
+    (0, 0x90, b'\x3c\x64'),
+    (10, 0x90, b'\x3e\x64'),
+    (0, 0xF0, b'\x41\x10\x42\x12\xf7'),
+    (0, 0xB0, b'\x07\x64'),
+    (0, 0xF0, b'\x41\x10\x42'),
+    (5, 0xF7, b'\x12\xf7'),
+    (0, 0xC0, b'\x05'),
+    (0, 0xC0, b'\x25'),
+    (96, 0x80, b'\x3c\x00'),
+    (0, 0xFF, b'\x2f'),
+]
+SPLIT_SYSEX = (6, 7)
+
+
+def smf(*tracks):
+    header = b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big') + len(tracks).to_bytes(2, 'big') \
+        + (480).to_bytes(2, 'big')
+    return header + b''.join(b'MTrk' + len(track).to_bytes(4, 'big') + track for track in tracks)
+
+
+class PackedRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, 'song.mid')
+        with open(self.path, 'wb') as f:
+            f.write(smf(TRACK))
+
+    def test_reads_events(self):
+        packed = read_packed_midi(self.path)
+        self.assertEqual(packed.ticks_per_beat, 480)
+        self.assertEqual(list(packed.tracks[0].events()), EVENTS)
+
+    def test_writes_same_bytes(self):
+        output_path = os.path.join(self.directory, 'out.mid')
+        write_smf(output_path, read_packed_midi(self.path).tracks, 480)
+        with open(output_path, 'rb') as f:
+            self.assertEqual(f.read(), smf(TRACK))
+
+    def test_unpacks_to_mido_messages(self):
+        messages = list(read_packed_midi(self.path).tracks[0])
+        self.assertEqual(messages[:6], [
+            mido.MetaMessage('track_name', name='n' * 200),
+            mido.MetaMessage('sequencer_specific', data=tuple(range(128))),
+            mido.Message('note_on', note=60, velocity=100),
+            mido.Message('note_on', note=62, velocity=100, time=10),
+            mido.Message('sysex', data=[0x41, 0x10, 0x42, 0x12]),
+            mido.Message('control_change', control=7, value=100),
+        ])
+        self.assertEqual(messages[SPLIT_SYSEX[0]], mido.Message('sysex', data=[0x41, 0x10, 0x42]))
+        self.assertEqual(messages[-2:], [mido.Message('note_off', note=60, velocity=0, time=96),
+                                         mido.MetaMessage('end_of_track')])
+
+    def test_packs_mido_messages(self):
+        # mido keeps no difference between a SysEx packet with and without F7
+        messages = list(mido.MidiFile(self.path).tracks[0])
+        events = list(PackedTrack.from_messages(messages).events())
+        expected = [event for i, event in enumerate(EVENTS) if i not in SPLIT_SYSEX]
+        self.assertEqual([event for i, event in enumerate(events) if i not in SPLIT_SYSEX], expected)
+
+    def test_meta_payload_sizes(self):
+        for size in (0, 1, 127, 128, 129, 16383, 16384):
+            with self.subTest(size=size):
+                msg = mido.MetaMessage('sequencer_specific', data=(size & 0x7F,) * size, time=size)
+                track = PackedTrack.from_messages([msg])
+                self.assertEqual(list(track.events()), [(size, 0xFF, b'\x7f' + bytes([size & 0x7F]) * size)])
+                self.assertEqual(list(track), [msg])
+
+
+if __name__ == '__main__':
+    unittest.main()
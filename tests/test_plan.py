@@ -0,0 +1,109 @@
+"""Tests for planning a conversion without converting."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import mido
+
+import gm1tosn
+from gm1tosn import BANK_NAMES, DRUM_CHANNEL, convert_midi, map_program, plan_file
+from tests.fixtures import DRUM_KITS, PARTS, gm1_song, part_track, quietly
+
+
+def final_parts(mid):
+    """Returns {channel: (msb, lsb, program)} as a converted MidiFile leaves each part."""
+    parts = {}
+    for track in mid.tracks:
+        banks = {}
+        for msg in track:
+            if msg.type == 'control_change' and msg.control in (0, 32):
+                banks.setdefault(msg.channel, [0, 0])[msg.control == 32] = msg.value
+            elif msg.type == 'program_change':
+                parts[msg.channel] = (*banks.get(msg.channel, (0, 0)), msg.program)
+    return parts
+
+
+def plan_parts(plan):
+    return {int(key): (part['msb'], part['lsb'], part['program']) for key, part in plan['parts'].items()}
+
+
+class PlanFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def save(self, mid, name='song.mid'):
+        path = os.path.join(self.directory, name)
+        mid.save(path)
+        return path
+
+    def test_matches_converter_for_one_program_per_track(self):
+        mid = mido.MidiFile(ticks_per_beat=480)
+        mid.tracks.append(mido.MidiTrack([mido.MetaMessage('set_tempo', tempo=500000)]))
+        for channel, programs in PARTS:
+            mid.tracks.append(part_track(channel, programs[1:]))
+        mid.tracks.append(part_track(DRUM_CHANNEL, (16,)))
+        plan = plan_file(self.save(mid))
+        output_mid, _ = quietly(convert_midi, mid)
+        self.assertEqual(plan_parts(plan), final_parts(output_mid))
+        self.assertEqual(plan_parts(plan)[DRUM_CHANNEL], map_program(DRUM_CHANNEL, 16)[:3])
+        self.assertTrue(plan['parts'][str(DRUM_CHANNEL)]['drums'])
+
+    def test_drum_part_matches_converter(self):
+        # No program change, one that keeps the init track's kit, and one that switches it
+        for kits in ((), (0,), (16,)):
+            with self.subTest(kits=kits):
+                mid = mido.MidiFile(ticks_per_beat=480)
+                drums = part_track(DRUM_CHANNEL, kits) if kits else mido.MidiTrack(
+                    [mido.Message('note_on', channel=DRUM_CHANNEL, note=36, velocity=90)])
+                mid.tracks.extend([part_track(0, (0,)), drums])
+                plan = plan_file(self.save(mid))
+                output_mid, _ = quietly(convert_midi, mid)
+                self.assertEqual(plan_parts(plan)[DRUM_CHANNEL], final_parts(output_mid)[DRUM_CHANNEL])
+
+    def test_parts_reflect_first_program_changes(self):
+        plan = plan_file(self.save(gm1_song()))
+        self.assertEqual([track['program'] for track in plan['tracks']],
+                         [None] + [programs[0] for _, programs in PARTS] + [DRUM_KITS[0]])
+        for channel, programs in PARTS:
+            self.assertEqual(plan_parts(plan)[channel], map_program(channel, programs[0])[:3])
+
+    def test_stops_at_first_program_change(self):
+        path = self.save(gm1_song())
+        read = []
+        iter_track_events = gm1tosn.iter_track_events
+
+        def counting(*args):
+            for event in iter_track_events(*args):
+                read.append(event)
+                yield event
+
+        with mock.patch.object(gm1tosn, 'iter_track_events', counting):
+            plan = plan_file(path)
+        # Conductor: 4 events plus End of Track; each part: name, bank select, program change
+        self.assertEqual(len(read), 5 + 3 * (len(PARTS) + 1))
+        msb, lsb, program, label = map_program(0, 0)
+        self.assertEqual(plan['tracks'][1], {'track': 2, 'channel': 0, 'program': 0, 'bank': BANK_NAMES[msb],
+                                             'msb': msb, 'lsb': lsb, 'target_program': program, 'tone': label})
+
+    def test_stops_at_max_ticks(self):
+        track = mido.MidiTrack([
+            mido.Message('note_on', channel=3, note=60, velocity=90),
+            mido.Message('note_off', channel=3, note=60, time=480),
+            mido.Message('program_change', channel=3, program=24, time=480),
+        ])
+        mid = mido.MidiFile(ticks_per_beat=480, tracks=[track])
+        path = self.save(mid)
+        plan = plan_file(path, max_ticks=480)
+        self.assertEqual(plan['tracks'], [{'track': 1, 'channel': 3, 'program': None}])
+        self.assertNotIn('3', plan['parts'])
+        plan = plan_file(path, max_ticks=960)
+        self.assertEqual(plan['tracks'][0]['program'], 24)
+        self.assertIn('3', plan['parts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
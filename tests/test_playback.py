@@ -0,0 +1,52 @@
+"""Tests for scheduled playback on several units."""
+import shutil
+import tempfile
+import unittest
+from array import array
+from unittest import mock
+
+import mido
+
+import gm1tosn
+from gm1tosn import DRUM_CHANNEL, ScheduledStream, load_song, play_units
+from tests.fixtures import quietly, save_song
+
+
+class RecordingPort:
+    """An output port that records what it is sent and how many messages were decoded by then."""
+
+    def __init__(self, decoded):
+        self.decoded = decoded
+        self.sent = []
+        self.decoded_at_send = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+        self.decoded_at_send.append(self.decoded.call_count)
+
+
+class PlayUnitsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        (_, streams, _), _ = quietly(load_song, save_song(directory, ports=2), (0x10, 0x11))
+        # Everything at once, so the test does not wait for the song
+        self.streams = [ScheduledStream(array('d', bytes(8 * len(stream))), stream.offsets, stream.data)
+                        for stream in streams]
+
+    def test_decodes_before_sending(self):
+        with mock.patch.object(gm1tosn.mido.Message, 'from_bytes', wraps=mido.Message.from_bytes) as decoded:
+            ports = [RecordingPort(decoded), RecordingPort(decoded)]
+            changes = play_units(self.streams, ports)
+        total = sum(len(stream) for stream in self.streams)
+        self.assertEqual(decoded.call_count, total)
+        for stream, port in zip(self.streams, ports):
+            self.assertEqual(port.sent, [mido.Message.from_bytes(message) for _, message in stream])
+            self.assertEqual(set(port.decoded_at_send), {total})
+        # The bass part and the drum kit change mid-track on both units
+        self.assertEqual(changes, [({2, DRUM_CHANNEL}, {2, DRUM_CHANNEL})] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
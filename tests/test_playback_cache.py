@@ -0,0 +1,96 @@
+"""Tests for the on-disk playback cache."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mido
+
+from gm1tosn import CACHE_SUFFIX, PlaybackCache, load_song
+from tests.fixtures import quietly
+
+
+def write_song(path, program):
+    """Writes a one-track GM1 song that selects ``program`` on channel 1."""
+    mid = mido.MidiFile(ticks_per_beat=480)
+    track = mido.MidiTrack()
+    mid.tracks.append(track)
+    track.append(mido.Message('program_change', program=program))
+    track.append(mido.Message('note_on', note=60, velocity=100, time=10))
+    track.append(mido.Message('note_off', note=60, time=480))
+    mid.save(path)
+
+
+class PlaybackCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.songs = []
+        for program in range(3):
+            path = os.path.join(self.directory, f"song{program}.mid")
+            write_song(path, program)
+            self.songs.append(path)
+        self.cache_dir = os.path.join(self.directory, 'cache')
+
+    def entries(self, cache):
+        return sorted(name for name in os.listdir(cache.directory) if name.endswith(CACHE_SUFFIX))
+
+    def test_round_trip(self):
+        cache = PlaybackCache(self.cache_dir)
+        (part_setup, streams, cached), _ = quietly(load_song, self.songs[0], (0x10,), cache)
+        self.assertFalse(cached)
+        (cached_setup, cached_streams, cached), _ = quietly(load_song, self.songs[0], (0x10,), cache)
+        self.assertTrue(cached)
+        self.assertEqual(cached_setup, part_setup)
+        self.assertEqual([list(stream) for stream in cached_streams], [list(stream) for stream in streams])
+        # Other device IDs are a different entry
+        self.assertIsNone(cache.get(cache.key(self.songs[0], (0x11,))))
+
+    def test_corrupt_entry_is_a_miss(self):
+        cache = PlaybackCache(self.cache_dir)
+        quietly(load_song, self.songs[0], (0x10,), cache)
+        path = os.path.join(cache.directory, self.entries(cache)[0])
+        with open(path, 'r+b') as f:
+            f.seek(8)
+            f.write(b'not json')
+        self.assertIsNone(cache.get(cache.key(self.songs[0], (0x10,))))
+        (_, _, cached), _ = quietly(load_song, self.songs[0], (0x10,), cache)
+        self.assertFalse(cached)
+
+    def test_evicts_least_recently_used(self):
+        cache = PlaybackCache(self.cache_dir)
+        keys = []
+        for song in self.songs[:2]:
+            quietly(load_song, song, (0x10,), cache)
+            keys.append(cache.key(song, (0x10,)))
+        sizes = [os.path.getsize(os.path.join(cache.directory, key + CACHE_SUFFIX)) for key in keys]
+        # Make the first song the most recently used, then add a third
+        os.utime(os.path.join(cache.directory, keys[1] + CACHE_SUFFIX), (time.time() - 60,) * 2)
+        cache.get(keys[0])
+        cache.max_bytes = sum(sizes) + 10
+        quietly(load_song, self.songs[2], (0x10,), cache)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(cache.key(self.songs[2], (0x10,))))
+
+    def test_unusable_directory_disables_cache(self):
+        cache, out = quietly(PlaybackCache, os.path.join(self.songs[0], 'cache'))
+        self.assertFalse(cache.enabled)
+        self.assertIn("Playback cache disabled", out)
+        (part_setup, streams, cached), _ = quietly(load_song, self.songs[0], (0x10,), cache)
+        self.assertFalse(cached)
+        self.assertTrue(streams[0])
+
+    def test_failed_write_still_plays(self):
+        cache = PlaybackCache(self.cache_dir)
+        shutil.rmtree(self.cache_dir)
+        (part_setup, streams, cached), out = quietly(load_song, self.songs[0], (0x10,), cache)
+        self.assertFalse(cached)
+        self.assertTrue(streams[0])
+        self.assertIn("Could not write playback cache entry", out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests for sharded conversion and merging the shard manifests."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from gm1tosn import main, select_shard, shard_key, write_manifest
+from tests.fixtures import quietly, save_song
+
+
+class SelectShardTest(unittest.TestCase):
+
+    def assert_partition(self, input_files, shards, key):
+        slices = [select_shard(input_files, index, shards, key) for index in range(1, shards + 1)]
+        self.assertEqual(sorted(f for files in slices for f in files), sorted(set(input_files)))
+        self.assertTrue(all(len(files) < len(input_files) for files in slices))
+        return slices
+
+    def test_path_shards_are_disjoint_and_cover_inputs(self):
+        input_files = [f"songs/{album}/{track:02}.mid" for album in 'abcd' for track in range(10)]
+        self.assert_partition(input_files + input_files[:3], 4, 'path')
+        # The same relative path picks the same shard however it is spelled
+        self.assertEqual(shard_key(f"./{input_files[0]}"), shard_key(input_files[0]))
+
+    def test_content_shards_are_disjoint_and_cover_inputs(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        input_files = []
+        for i in range(12):
+            path = os.path.join(directory, f"{i}.mid")
+            with open(path, 'wb') as f:
+                f.write(bytes([i]) * 16)
+            input_files.append(path)
+        missing = os.path.join(directory, 'missing.mid')
+        self.assert_partition(input_files + [missing], 3, 'content')
+
+
+class ShardManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_unreadable_file_is_recorded_as_failed(self):
+        song = save_song(self.directory)
+        manifest_path = self.path('shard.json')
+        status, _ = quietly(main, [song, self.path('missing.mid'), '--shard', '1/1',
+                                   '--shard-key', 'content', '--manifest', manifest_path])
+        self.assertEqual(status, 1)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['status'], 'failed')
+        entries = {os.path.basename(entry['input']): entry for entry in manifest['files']}
+        self.assertEqual(entries['song.mid']['status'], 'ok')
+        self.assertEqual(entries['missing.mid']['status'], 'error')
+        self.assertIn("Error opening MIDI file", entries['missing.mid']['error'])
+
+    def write_shard(self, index, status, files):
+        write_manifest(self.path(f"shard-{index}.json"), {
+            'shard': index, 'shards': 3, 'shard_key': 'path', 'status': status,
+            'files': [dict(entry, seconds=0.5) for entry in files]})
+
+    def merge(self):
+        report_path = self.path('report.json')
+        status, out = quietly(main, ['merge-reports', self.path('shard-*.json'), '-o', report_path])
+        with open(report_path) as f:
+            return status, json.load(f), out
+
+    def test_merge_reports_flags_missing_incomplete_and_failed_shards(self):
+        self.write_shard(1, 'ok', [{'input': 'a.mid', 'status': 'ok', 'mapping': {'0:0': ['Piano']}}])
+        self.write_shard(2, 'incomplete', [{'input': 'b.mid', 'status': 'error', 'error': 'bad'}])
+        status, report, out = self.merge()
+        self.assertEqual(status, 1)
+        self.assertEqual(report['missing_shards'], [3])
+        self.assertEqual(report['incomplete_shards'], [2])
+        self.assertEqual((report['files'], report['ok'], report['failed']), (2, 1, 1))
+        self.assertEqual(report['failures'][0]['input'], 'b.mid')
+        self.assertEqual(report['mapping'], {'0:0': {'Piano': 1}})
+        self.assertIn("re-run it with --shard 2/3", out)
+
+    def test_merge_reports_flags_failed_files(self):
+        for index in (1, 2):
+            self.write_shard(index, 'ok', [{'input': f"{index}.mid", 'status': 'ok'}])
+        self.write_shard(3, 'failed', [{'input': 'c.mid', 'status': 'error', 'error': 'bad'}])
+        status, report, _ = self.merge()
+        self.assertEqual(status, 1)
+        self.assertEqual((report['missing_shards'], report['incomplete_shards'], report['failed']), ([], [], 1))
+
+    def test_merge_reports_clean_run(self):
+        for index in (1, 2, 3):
+            self.write_shard(index, 'ok', [{'input': f"{index}.mid", 'status': 'ok'}])
+        status, report, _ = self.merge()
+        self.assertEqual(status, 0)
+        self.assertEqual((report['files'], report['failed'], report['seconds']), (3, 0, 1.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
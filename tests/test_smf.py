@@ -0,0 +1,118 @@
+"""Tests for the compact SMF writer."""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import mido
+
+import gm1tosn
+from gm1tosn import PackedTrack, _write_track_chunk, map_gm1_to_supernatural
+from tests.fixtures import quietly, save_song
+
+END_OF_TRACK = b'\xff\x2f\x00'
+
+
+def chunk_body(events):
+    """Writes a PackedTrack of (delta, status, data) events and returns the MTrk chunk body."""
+    track = PackedTrack()
+    for delta, status, data in events:
+        track.append_event(delta, status, bytes(data))
+    f = io.BytesIO()
+    _write_track_chunk(f, track)
+    chunk = f.getvalue()
+    assert chunk[:4] == b'MTrk'
+    assert int.from_bytes(chunk[4:8], 'big') == len(chunk) - 8
+    return chunk[8:]
+
+
+class WriteTrackChunkTest(unittest.TestCase):
+
+    def test_running_status(self):
+        body = chunk_body([(0, 0x90, [60, 100]), (10, 0x90, [60, 0]), (0, 0x80, [61, 0])])
+        self.assertEqual(body, b'\x00\x90\x3c\x64' b'\x0a\x3c\x00' b'\x00\x80\x3d\x00' b'\x00' + END_OF_TRACK)
+
+    def test_running_status_is_reset_after_meta_and_sysex(self):
+        body = chunk_body([(0, 0x90, [60, 100]), (0, 0xFF, b'\x01hi'), (0, 0x90, [61, 100]),
+                           (0, 0xF0, [0x41, 0xF7]), (0, 0x90, [62, 100])])
+        self.assertEqual(body, b'\x00\x90\x3c\x64' b'\x00\xff\x01\x02hi' b'\x00\x90\x3d\x64'
+                               b'\x00\xf0\x02\x41\xf7' b'\x00\x90\x3e\x64' b'\x00' + END_OF_TRACK)
+
+    def test_fillers_are_folded_into_next_delta(self):
+        body = chunk_body([(0, 0x90, [60, 100]), (10, 0x90, [0, 0]), (20, 0x90, [0, 0]),
+                           (5, 0x80, [60, 0])])
+        self.assertEqual(body, b'\x00\x90\x3c\x64' b'\x23\x80\x3c\x00' b'\x00' + END_OF_TRACK)
+
+    def test_note_zero_off_is_kept_while_sounding(self):
+        body = chunk_body([(0, 0x90, [0, 100]), (10, 0x90, [0, 0]), (10, 0x90, [0, 0])])
+        # The first note off ends the note; the second is a filler again
+        self.assertEqual(body, b'\x00\x90\x00\x64' b'\x0a\x00\x00' b'\x0a' + END_OF_TRACK)
+
+    def test_end_of_track_is_written_once_with_its_delta(self):
+        body = chunk_body([(0, 0x90, [60, 100]), (10, 0x90, [0, 0]), (200, 0xFF, b'\x2f')])
+        self.assertEqual(body.count(END_OF_TRACK), 1)
+        self.assertTrue(body.endswith(b'\x81\x52' + END_OF_TRACK))  # 210 ticks
+        self.assertEqual(chunk_body([]), b'\x00' + END_OF_TRACK)
+
+    def test_mido_track(self):
+        track = mido.MidiTrack([mido.Message('note_on', note=60, velocity=100),
+                                mido.MetaMessage('end_of_track', time=5)])
+        f = io.BytesIO()
+        _write_track_chunk(f, track)
+        self.assertEqual(f.getvalue()[8:], b'\x00\x90\x3c\x64' b'\x05' + END_OF_TRACK)
+
+
+class MapToSupernaturalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.input_path = save_song(self.directory)
+        self.output_path = os.path.join(self.directory, 'SNsong.mid')
+
+    def test_conversion_error_leaves_no_file(self):
+        convert_track = gm1tosn.convert_track
+        calls = []
+
+        def failing(*args, **kwargs):
+            calls.append(None)
+            if len(calls) == 3:
+                raise KeyError('broken track')
+            return convert_track(*args, **kwargs)
+
+        with mock.patch.object(gm1tosn, 'convert_track', failing):
+            (mapping, error), _ = quietly(map_gm1_to_supernatural, self.input_path, self.output_path)
+        self.assertIsNone(mapping)
+        self.assertIn("Error converting MIDI file", error)
+        self.assertEqual(os.listdir(self.directory), ['song.mid'])
+
+    def test_failed_conversion_keeps_previous_output(self):
+        with open(self.output_path, 'wb') as f:
+            f.write(b'previous')
+        with mock.patch.object(gm1tosn, 'convert_track', side_effect=RuntimeError('broken')):
+            (_, error), _ = quietly(map_gm1_to_supernatural, self.input_path, self.output_path)
+        self.assertIn("Error converting MIDI file: broken", error)
+        with open(self.output_path, 'rb') as f:
+            self.assertEqual(f.read(), b'previous')
+        self.assertFalse(os.path.exists(self.output_path + '.tmp'))
+
+    def test_save_error(self):
+        output_path = os.path.join(self.directory, 'missing', 'SNsong.mid')
+        (mapping, error), _ = quietly(map_gm1_to_supernatural, self.input_path, output_path)
+        self.assertIsNone(mapping)
+        self.assertIn("Error saving MIDI file", error)
+
+    def test_success_replaces_output(self):
+        with open(self.output_path, 'wb') as f:
+            f.write(b'previous')
+        (mapping, error), _ = quietly(map_gm1_to_supernatural, self.input_path, self.output_path)
+        self.assertIsNone(error)
+        self.assertTrue(mapping)
+        self.assertEqual(len(mido.MidiFile(self.output_path).tracks), 6)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['SNsong.mid', 'song.mid'])
+
+
+if __name__ == '__main__':
+    unittest.main()
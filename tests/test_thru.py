@@ -0,0 +1,153 @@
+"""Tests for the live thru filter and the ``thru`` subcommand."""
+import sys
+import types
+import unittest
+from unittest import mock
+
+import mido
+
+import gm1tosn
+from gm1tosn import DRUM_CHANNEL, ThruFilter, _open_rtmidi_port, map_program
+from integra7_sim import Integra7Simulator
+from tests.fixtures import quietly
+
+
+class ThruFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = Integra7Simulator()
+        self.sent = []
+        self.thru = ThruFilter(self.send, samples=16)
+
+    def send(self, message):
+        self.sent.append(bytes(message))
+        self.simulator.send(mido.Message.from_bytes(list(message)))
+
+    def test_swallows_bank_select(self):
+        self.thru.process([0xB1, 0, 5])
+        self.thru.process([0xB1, 32, 1])
+        self.assertEqual(self.sent, [])
+
+    def test_passes_other_messages(self):
+        for message in ([0x91, 60, 100], [0xB1, 7, 90], [0xE1, 0, 64], [0x81, 60, 0]):
+            self.thru.process(message)
+        self.assertEqual(self.sent, [b'\x91\x3c\x64', b'\xb1\x07\x5a', b'\xe1\x00\x40', b'\x81\x3c\x00'])
+
+    def test_maps_program_change(self):
+        self.thru.process([0xC1, 0])
+        msb, lsb, program, _ = map_program(1, 0)
+        self.assertEqual(len(self.sent), 4)
+        self.assertEqual(self.simulator.part_tones()[1][1:], (msb, lsb, program))
+        # The same tone again sends nothing
+        self.thru.process([0xC1, 0])
+        self.assertEqual(len(self.sent), 4)
+
+    def test_deduplicates_drum_kits(self):
+        # Two GM1 programs that select the same drum kit
+        first, second = [program for program in range(128) if map_program(DRUM_CHANNEL, program)[2] == 0][:2]
+        status = 0xC0 | DRUM_CHANNEL
+        self.thru.process([status, first])
+        self.assertEqual(len(self.sent), 4)
+        self.thru.process([status, second])
+        self.assertEqual(len(self.sent), 4)
+        self.assertEqual(self.thru.count, 2)
+
+
+class FakePort:
+    """Stands in for an rtmidi MidiIn or MidiOut."""
+
+    available = ['Midi Through:Midi Through Port-0 14:0', 'INTEGRA-7:INTEGRA-7 MIDI 1 20:0']
+
+    def __init__(self):
+        self.opened = None
+        self.callback = None
+        self.sent = []
+
+    def get_ports(self):
+        return list(self.available)
+
+    def open_port(self, index):
+        self.opened = ('port', index)
+
+    def open_virtual_port(self, name):
+        self.opened = ('virtual', name)
+
+    def close_port(self):
+        pass
+
+    def ignore_types(self, **kwargs):
+        pass
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def cancel_callback(self):
+        self.callback = None
+
+    def send_message(self, message):
+        self.sent.append(list(message))
+
+
+class OpenRtmidiPortTest(unittest.TestCase):
+
+    def test_opens_virtual_port(self):
+        port = FakePort()
+        _open_rtmidi_port(port, 'GM1 in', virtual=True)
+        self.assertEqual(port.opened, ('virtual', 'GM1 in'))
+
+    def test_opens_port_by_partial_name(self):
+        port = FakePort()
+        _open_rtmidi_port(port, 'INTEGRA-7', virtual=False)
+        self.assertEqual(port.opened, ('port', 1))
+
+    def test_missing_port(self):
+        with self.assertRaises(ValueError) as context:
+            _open_rtmidi_port(FakePort(), 'Keyboard', virtual=False)
+        self.assertIn("Midi Through", str(context.exception))
+
+
+class ThruMainTest(unittest.TestCase):
+
+    def run_thru(self, argv, events=()):
+        """Runs ``thru`` against fake rtmidi ports, feeding ``events`` in before Ctrl-C."""
+        midi_in, midi_out = FakePort(), FakePort()
+        rtmidi = types.ModuleType('rtmidi')
+        rtmidi.MidiIn = lambda: midi_in
+        rtmidi.MidiOut = lambda: midi_out
+
+        def sleep(seconds):
+            for message in events:
+                midi_in.callback((message, 0.0), None)
+            raise KeyboardInterrupt
+
+        with mock.patch.dict(sys.modules, rtmidi=rtmidi), \
+                mock.patch.object(gm1tosn.time, 'sleep', sleep):
+            status, out = quietly(gm1tosn.main, ['thru', *argv])
+        return status, out, midi_in, midi_out
+
+    def test_virtual_ports(self):
+        status, out, midi_in, midi_out = self.run_thru(
+            ['--input', 'GM1 in', '--output', 'SN out', '--virtual', '--device-id', '0x11'],
+            [[0xB0, 0, 0], [0xC0, 0], [0x90, 60, 100]])
+        self.assertEqual(status, 0)
+        self.assertEqual(midi_in.opened, ('virtual', 'GM1 in'))
+        self.assertEqual(midi_out.opened, ('virtual', 'SN out'))
+        self.assertIsNone(midi_in.callback)
+        # The bank type SysEx goes to the chosen device, then bank select, program and the note
+        self.assertEqual(midi_out.sent[0][2], 0x11)
+        self.assertEqual([message[0] for message in midi_out.sent], [0xF0, 0xB0, 0xB0, 0xC0, 0x90])
+        self.assertIn("Processed 3 message(s)", out)
+
+    def test_existing_ports(self):
+        status, _, midi_in, midi_out = self.run_thru(['--input', 'Midi Through', '--output', 'INTEGRA'])
+        self.assertEqual(status, 0)
+        self.assertEqual((midi_in.opened, midi_out.opened), (('port', 0), ('port', 1)))
+
+    def test_missing_port(self):
+        status, out, _, _ = self.run_thru(['--input', 'Keyboard', '--output', 'INTEGRA'])
+        self.assertEqual(status, 1)
+        self.assertIn("MIDI port 'Keyboard' not found", out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests for spreading source ports over several Integra-7 units."""
+import unittest
+
+from gm1tosn import (
+    COMMAND_DT1,
+    MIDI_PORT_META,
+    PackedMidiFile,
+    convert_midi,
+    parse_sysex,
+    split_units,
+    track_port,
+)
+from tests.fixtures import gm1_song, quietly
+
+DEVICE_IDS = (0x10, 0x13)
+
+
+def has_channel_messages(track):
+    return any(status < 0xF0 for _, status, _ in track.events())
+
+
+class UnitsTest(unittest.TestCase):
+
+    def convert(self, ports, device_ids=DEVICE_IDS):
+        mid = PackedMidiFile.from_midi_file(gm1_song(ports))
+        output_mid, _ = quietly(convert_midi, mid, device_ids=device_ids)
+        return output_mid
+
+    def test_shared_channel_on_a_unit_is_an_error(self):
+        # Ports 0 and 2 both play on unit 0
+        with self.assertRaises(ValueError) as context:
+            quietly(convert_midi, PackedMidiFile.from_midi_file(gm1_song(3)), device_ids=DEVICE_IDS)
+        self.assertIn("ports 0, 2 on unit 0 channel 1", str(context.exception))
+
+    def test_shared_channel_on_one_unit_is_a_warning(self):
+        mid = PackedMidiFile.from_midi_file(gm1_song(2))
+        _, out = quietly(convert_midi, mid, device_ids=DEVICE_IDS[:1])
+        self.assertIn("Warning: source ports share parts", out)
+
+    def test_init_tracks_use_unit_device_ids(self):
+        output_mid = self.convert(2)
+        for unit, device_id in enumerate(DEVICE_IDS):
+            init_track = output_mid.tracks[unit]
+            self.assertEqual(track_port(init_track), unit)
+            sysex = [parse_sysex(data) for _, status, data in init_track.events() if status == 0xF0]
+            self.assertTrue(sysex)
+            self.assertEqual({(found_id, command) for found_id, command, _, _ in sysex},
+                             {(device_id, COMMAND_DT1)})
+
+    def test_midi_ports_are_rewritten_to_units(self):
+        output_mid = self.convert(2)
+        ports = [data[1] for track in output_mid.tracks for _, status, data in track.events()
+                 if status == 0xFF and data[0] == MIDI_PORT_META]
+        self.assertEqual(ports, [0, 1] + [0] * 4 + [1] * 4)
+
+    def test_conductor_track_goes_to_every_unit(self):
+        output_mid = self.convert(2)
+        conductor = output_mid.tracks[len(DEVICE_IDS)]
+        self.assertFalse(has_channel_messages(conductor))
+        unit_files = split_units(output_mid, len(DEVICE_IDS))
+        self.assertEqual(len(unit_files), len(DEVICE_IDS))
+        for unit, unit_file in enumerate(unit_files):
+            self.assertIs(unit_file.tracks[0], output_mid.tracks[unit])
+            self.assertIn(conductor, unit_file.tracks)
+            part_tracks = [track for track in unit_file.tracks[1:] if has_channel_messages(track)]
+            self.assertEqual(len(part_tracks), 4)
+            self.assertTrue(all(track_port(track) == unit for track in part_tracks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Tests for verify: a fresh conversion passes and tampering is reported."""
+import shutil
+import tempfile
+import unittest
+
+import mido
+
+from gm1tosn import map_gm1_to_supernatural, verify_conversion
+from tests.fixtures import quietly, save_song
+
+FIRST_PART = 2  # Output track of the first part: init track, then the conductor track
+
+
+class VerifyConversionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.input_path = save_song(cls.directory)
+        cls.output_path = f"{cls.directory}/SNsong.mid"
+        (_, error), _ = quietly(map_gm1_to_supernatural, cls.input_path, cls.output_path)
+        assert error is None, error
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, True)
+
+    def verify_tampered(self, tamper):
+        mid = mido.MidiFile(self.output_path)
+        tamper(mid.tracks[FIRST_PART])
+        path = f"{self.directory}/tampered.mid"
+        mid.save(path)
+        diffs, _ = quietly(verify_conversion, self.input_path, path)
+        return diffs
+
+    def test_fresh_conversion_verifies(self):
+        diffs, out = quietly(verify_conversion, self.input_path, self.output_path)
+        self.assertEqual(diffs, [])
+        self.assertIn("OK:", out)
+
+    def test_resaved_output_verifies(self):
+        # mido writes the settle fillers the compact writer folds away
+        self.assertEqual(self.verify_tampered(lambda track: None), [])
+
+    def test_shifted_note_is_reported(self):
+        def shift(track):
+            index = next(i for i, msg in enumerate(track) if msg.type == 'note_on' and msg.velocity)
+            track[index].time += 1
+        diffs = self.verify_tampered(shift)
+        self.assertEqual(len(diffs), 1)
+        self.assertIn("note_on", diffs[0])
+
+    def test_stray_all_notes_off_is_reported(self):
+        def insert(track):
+            # Before the last note off, far from any program change block
+            index = max(i for i, msg in enumerate(track) if msg.type == 'note_off')
+            track.insert(index, mido.Message('control_change', channel=0, control=123, value=0))
+        diffs = self.verify_tampered(insert)
+        self.assertEqual(len(diffs), 1)
+        self.assertIn("control=123", diffs[0])
+
+    def test_wrong_program_is_reported(self):
+        def reprogram(track):
+            msg = next(msg for msg in track if msg.type == 'program_change')
+            msg.program = (msg.program + 1) % 128
+        diffs = self.verify_tampered(reprogram)
+        self.assertEqual(len(diffs), 1)
+        self.assertIn("program", diffs[0])
+
+
+if __name__ == '__main__':
+    unittest.main()